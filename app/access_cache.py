@@ -0,0 +1,186 @@
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .tickets import record_revocation
+
+logger = logging.getLogger(__name__)
+
+# Backstops only: every ownership/share change invalidates the affected robot's decisions.
+ACCESS_CACHE_TTL_SECONDS = int(os.getenv("ACCESS_CACHE_TTL_SECONDS", "60"))
+ACCESS_LOCAL_TTL_SECONDS = 10
+ACCESS_LOCAL_MAX = 1024
+# Per-user robot lists for /listrobots, dropped on any access change seen on 'revoke:'.
+ROBOT_LIST_TTL_SECONDS = 30
+# Only has to outlive a decision being computed; see _FILL_SCRIPT.
+ACCESS_VERSION_TTL_SECONDS = 86400
+
+# Store a decision only if the robot's version is still the one read before computing it.
+# invalidate() bumps the version before its DEL, so a fill racing an invalidation on any
+# instance either lands before the DEL or is refused here.
+_FILL_SCRIPT = """
+if (redis.call('GET', KEYS[2]) or '') ~= ARGV[1] then
+    return 0
+end
+redis.call('HSET', KEYS[1], ARGV[2], ARGV[3])
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return 1
+"""
+
+
+def access_key(robot_id: str) -> str:
+    return f"access:{robot_id}"
+
+
+def access_version_key(robot_id: str) -> str:
+    return f"access_version:{robot_id}"
+
+
+class AccessCache:
+    """
+    Caches check_robot_access / check_robot_ownership decisions per (robot, user), so the
+    websocket connect, /ticket and MediaMTX read webhook (which fires again on every
+    WebRTC reconnect) don't each cost a Postgres session.
+
+    Two tiers: a small in-process LRU, then a Redis hash per robot, 'access:{robot_id}',
+    whose fields are the decisions for that robot ("1:<expires_at>" / "0:<expires_at>").
+    Keeping a robot's decisions in one hash lets invalidate() drop them all with one DEL.
+    A counter per robot, 'access_version:{robot_id}', is bumped by every invalidation and
+    checked when a decision is stored, so one computed before it is never cached.
+
+    invalidate() is called after every change to a robot's ownership or shares. It also
+    publishes on the 'revoke:' channel so every instance drops its local copies; the
+    existing 'revoke:{email}' message that boots a guest doubles as that notification.
+    """
+    def __init__(self):
+        self.redis = None  # set by TelemetryManager.connect(); without it only the local tier is used
+        self.local: "OrderedDict[Tuple[str, str], Tuple[bool, float]]" = OrderedDict()
+        # Bumped on every invalidation (of one robot, or of everything), so a decision
+        # computed across an invalidation isn't cached.
+        self.generations: Dict[str, int] = {}
+        self.epoch = 0
+        # (user_id, email) -> ([(robot_id, nickname, role)], expires_at)
+        self.robot_lists: Dict[Tuple[str, str], Tuple[List[tuple], float]] = {}
+        self.robot_lists_epoch = 0
+        self._fill = None
+
+    async def decide(self, robot_id: str, subject: str, compute: Callable[[], Awaitable[bool]]) -> bool:
+        """The cached decision for subject on robot_id, computing and caching it on a miss."""
+        key = (robot_id, subject)
+        cached = self.local.get(key)
+        if cached and time.monotonic() < cached[1]:
+            self.local.move_to_end(key)
+            return cached[0]
+
+        allowed, version = await self._get_shared(robot_id, subject)
+        if allowed is None:
+            generation = (self.epoch, self.generations.get(robot_id, 0))
+            allowed = await compute()
+            if (self.epoch, self.generations.get(robot_id, 0)) != generation:
+                return allowed  # invalidated while we were asking Postgres; don't cache
+            if version is not None:
+                await self._set_shared(robot_id, subject, allowed, version)
+        self._set_local(key, allowed)
+        return allowed
+
+    async def _get_shared(self, robot_id: str, subject: str) -> Tuple[Optional[bool], Optional[str]]:
+        """(cached decision or None, the robot's access version); the version is None if Redis can't be read."""
+        if self.redis is None:
+            return None, None
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.hget(access_key(robot_id), subject)
+            pipe.get(access_version_key(robot_id))
+            value, version = await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Access cache read failed for {robot_id}: {e}")
+            return None, None
+        version = str(version or "")
+        if not value:
+            return None, version
+        allowed, _, expires_at = value.partition(":")
+        if time.time() >= float(expires_at):
+            return None, version
+        return allowed == "1", version
+
+    async def _set_shared(self, robot_id: str, subject: str, allowed: bool, version: str):
+        value = f"{int(allowed)}:{time.time() + ACCESS_CACHE_TTL_SECONDS}"
+        if self._fill is None or self._fill.registered_client is not self.redis:
+            self._fill = self.redis.register_script(_FILL_SCRIPT)
+        try:
+            # The hash goes away once a robot's decisions stop being used.
+            await self._fill(
+                keys=[access_key(robot_id), access_version_key(robot_id)],
+                args=[version, subject, value, ACCESS_CACHE_TTL_SECONDS],
+            )
+        except Exception as e:
+            logger.warning(f"Access cache write failed for {robot_id}: {e}")
+
+    def _set_local(self, key: Tuple[str, str], allowed: bool):
+        self.local[key] = (allowed, time.monotonic() + ACCESS_LOCAL_TTL_SECONDS)
+        self.local.move_to_end(key)
+        while len(self.local) > ACCESS_LOCAL_MAX:
+            self.local.popitem(last=False)
+
+    async def robot_list(self, user_id: str, user_email: str, compute: Callable[[], Awaitable[List[tuple]]]) -> List[tuple]:
+        """
+        The user's (robot_id, nickname, role) rows, from this instance's cache when fresh.
+        Any access change may add a robot to someone's list (a new share names a guest
+        by email only), so every invalidation drops all cached lists.
+        """
+        key = (user_id, user_email)
+        cached = self.robot_lists.get(key)
+        if cached and time.monotonic() < cached[1]:
+            return cached[0]
+        epoch = self.robot_lists_epoch
+        robots = await compute()
+        if epoch == self.robot_lists_epoch:
+            now = time.monotonic()
+            if len(self.robot_lists) >= ACCESS_LOCAL_MAX:
+                self.robot_lists = {k: v for k, v in self.robot_lists.items() if now < v[1]}
+            self.robot_lists[key] = (robots, now + ROBOT_LIST_TTL_SECONDS)
+        return robots
+
+    def drop_local(self, robot_id: str):
+        """Forget this instance's decisions for robot_id (on a 'revoke:' message)."""
+        self.generations[robot_id] = self.generations.get(robot_id, 0) + 1
+        for key in [k for k in self.local if k[0] == robot_id]:
+            del self.local[key]
+        self._drop_robot_lists()
+
+    def clear_local(self):
+        """Forget everything local, e.g. after missing 'revoke:' messages while disconnected."""
+        self.epoch += 1
+        self.local.clear()
+        self._drop_robot_lists()
+
+    def _drop_robot_lists(self):
+        self.robot_lists_epoch += 1
+        self.robot_lists.clear()
+
+    async def invalidate(self, robot_id: str, revoked_email: str = ""):
+        """
+        Drop every cached decision for robot_id, here and on all instances. With
+        revoked_email, that guest's live connections to the robot are closed and their
+        signed stream tickets for it refused as well.
+        """
+        self.drop_local(robot_id)
+        if self.redis is None:
+            return
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.incr(access_version_key(robot_id))
+            pipe.expire(access_version_key(robot_id), ACCESS_VERSION_TTL_SECONDS)
+            pipe.delete(access_key(robot_id))
+            record_revocation(pipe, revoked_email, robot_id)
+            pipe.publish(f"revoke:{revoked_email.lower()}", robot_id)
+            await pipe.execute()
+        except Exception as e:
+            # The change itself is already committed; decisions cached elsewhere still
+            # expire within ACCESS_CACHE_TTL_SECONDS.
+            logger.warning(f"Access cache invalidation failed for {robot_id}: {e}")
+
+
+access_cache = AccessCache()
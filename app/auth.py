@@ -1,11 +1,11 @@
+import asyncio
 import logging
 import os
+import time
 from typing import Optional, Annotated
-import firebase_admin
-from firebase_admin import auth as firebase_auth
 from fastapi import HTTPException, status, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy import select
+from sqlalchemy import select, exists, case, null, literal, union_all, false
 from sqlalchemy.dialects.postgresql import insert as pg_insert
 from .database import (
     async_session,
@@ -15,7 +15,11 @@ from .database import (
     EMPLOYEE_ROLES,
     ROLE_EMPLOYEE_ADMIN,
 )
-from .tickets import get_ticket
+from .tickets import get_ticket, ticket_email_matches
+from .token_verifier import token_verifier
+from .lazy_imports import firebase_auth
+from .sdk_calls import firebase_calls
+from .access_cache import access_cache
 from urllib.parse import parse_qs
 
 logger = logging.getLogger(__name__)
@@ -29,12 +33,13 @@ BOOTSTRAP_ADMIN_EMAILS = frozenset(
     if e.strip()
 )
 
-# Initialize Firebase Admin SDK
-# On Cloud Run, this automatically uses the default service account.
-try:
-    firebase_admin.get_app()
-except ValueError:
-    firebase_admin.initialize_app()
+# How long a UID -> email lookup is reused for the admin roster before asking Firebase again.
+USER_EMAIL_CACHE_TTL_SECONDS = 300
+# firebase_auth.get_users accepts at most this many identifiers per call.
+GET_USERS_BATCH_SIZE = 100
+
+# Firebase UID -> (email, cached at), filled by emails_for_uids and resolve_email_to_user.
+_user_email_cache: dict[str, tuple[Optional[str], float]] = {}
 
 async def verify_google_token(token: str) -> dict:
     """
@@ -42,9 +47,12 @@ async def verify_google_token(token: str) -> dict:
     Returns the decoded token dictionary containing 'uid', 'email', and custom claims.
     """
     try:
-        # check_revoked=True adds a bit of latency but is safer for security-sensitive apps
-        decoded_token = firebase_auth.verify_id_token(token, check_revoked=True)
+        # Signature and claims are checked locally and cached per token; revocation is
+        # re-checked with Firebase at most every REVOCATION_CHECK_SECONDS per user.
+        decoded_token = await token_verifier.verify(token)
         return decoded_token
+    except HTTPException:
+        raise  # Firebase didn't answer in time; not the token's fault
     except firebase_auth.RevokedIdTokenError:
         logger.warning("Token has been revoked")
         raise HTTPException(status_code=401, detail="Token revoked")
@@ -86,30 +94,45 @@ async def list_user_roles() -> dict[str, set[str]]:
         return roles_by_user
 
 
-def emails_for_uids(uids: list[str]) -> dict[str, Optional[str]]:
+async def emails_for_uids(uids: list[str]) -> dict[str, Optional[str]]:
     """Best-effort map of Firebase UID -> email, for display in the admin UI.
 
-    One lookup per UID — fine for the small set of users who hold roles. A UID
-    Firebase can't resolve (e.g. a deleted account) is simply absent from the
-    result rather than failing the whole listing.
+    UIDs not in the cache are looked up with get_users in batches of up to 100,
+    all batches at once on the Firebase executor. A UID Firebase can't resolve
+    (e.g. a deleted account) is simply absent from the result rather than
+    failing the whole listing.
     """
+    now = time.monotonic()
     emails: dict[str, Optional[str]] = {}
-    for uid in uids:
-        try:
-            emails[uid] = firebase_auth.get_user(uid).email
-        except firebase_auth.UserNotFoundError:
-            continue
+    missing = []
+    for uid in dict.fromkeys(uids):
+        cached = _user_email_cache.get(uid)
+        if cached and now - cached[1] < USER_EMAIL_CACHE_TTL_SECONDS:
+            emails[uid] = cached[0]
+        else:
+            missing.append(uid)
+
+    batches = [missing[i:i + GET_USERS_BATCH_SIZE] for i in range(0, len(missing), GET_USERS_BATCH_SIZE)]
+    results = await asyncio.gather(*(
+        firebase_calls.run(firebase_auth.get_users, [firebase_auth.UidIdentifier(uid) for uid in batch])
+        for batch in batches
+    ))
+    for result in results:
+        for record in result.users:
+            emails[record.uid] = record.email
+            _user_email_cache[record.uid] = (record.email, now)
     return emails
 
 
-def resolve_email_to_user(email: str) -> Optional[tuple[str, str]]:
+async def resolve_email_to_user(email: str) -> Optional[tuple[str, str]]:
     """Resolve an email to (uid, email) via Firebase, or None if no such user.
 
     Lets an admin grant a role to someone who holds none yet — the only way to
     learn their UID, since the database keys everything by UID.
     """
     try:
-        record = firebase_auth.get_user_by_email(email)
+        record = await firebase_calls.run(firebase_auth.get_user_by_email, email)
+        _user_email_cache[record.uid] = (record.email, time.monotonic())
         return record.uid, record.email
     except firebase_auth.UserNotFoundError:
         return None
@@ -192,53 +215,94 @@ async def require_admin(
     return user
 
 
-async def check_robot_ownership(user_id: str, robot_id: str) -> bool:
-    """Queries Postgres to see if this specific user strictly owns this robot."""
-    async with async_session() as session:
-        result = await session.execute(
-            select(RobotOwnership).where(
-                RobotOwnership.user_id == user_id,
-                RobotOwnership.robot_id == robot_id
-            )
+ROBOT_ROLE_OWNER = "owner"
+ROBOT_ROLE_GUEST = "guest"
+
+
+def _robot_role_query(user_id: str, user_email: Optional[str], robot_id: str):
+    """One row, one column: 'owner', 'guest' or NULL. Both lookups are EXISTS probes on
+    the primary key / unique index, so no ORM entity is loaded."""
+    owner = exists().where(RobotOwnership.user_id == user_id, RobotOwnership.robot_id == robot_id)
+    whens = [(owner, ROBOT_ROLE_OWNER)]
+    if user_email:
+        guest = exists().where(
+            RobotSharedAccess.robot_id == robot_id,
+            RobotSharedAccess.guest_email == user_email.lower(),
         )
-        ownership_record = result.scalar_one_or_none()
-        
-        if ownership_record:
-            return True
-            
-        return False
+        whens.append((guest, ROBOT_ROLE_GUEST))
+    return select(case(*whens, else_=null()))
+
+
+async def get_robot_role(user_id: str, user_email: Optional[str], robot_id: str) -> Optional[str]:
+    """The user's relationship to this robot ('owner' or 'guest'), or None, in one round trip."""
+    async with async_session() as session:
+        result = await session.execute(_robot_role_query(user_id, user_email, robot_id))
+        return result.scalar_one()
+
+async def check_robot_ownership(user_id: str, robot_id: str) -> bool:
+    """Whether this specific user strictly owns this robot (cached, see AccessCache)."""
+    return await access_cache.decide(robot_id, f"owner:{user_id}", lambda: _query_robot_ownership(user_id, robot_id))
+
+async def _query_robot_ownership(user_id: str, robot_id: str) -> bool:
+    return await get_robot_role(user_id, None, robot_id) == ROBOT_ROLE_OWNER
 
 async def check_robot_access(user_id: str, user_email: Optional[str], robot_id: str) -> bool:
+    """Whether the user owns the robot or it is shared with their email (cached, see AccessCache)."""
+    subject = f"access:{user_id}:{(user_email or '').lower()}"
+    return await access_cache.decide(robot_id, subject, lambda: _query_robot_access(user_id, user_email, robot_id))
+
+async def _query_robot_access(user_id: str, user_email: Optional[str], robot_id: str) -> bool:
+    role = await get_robot_role(user_id, user_email, robot_id)
+    if role == ROBOT_ROLE_OWNER:
+        logger.info(f"Access granted: User {user_id} owns Robot {robot_id}")
+        return True
+    if role == ROBOT_ROLE_GUEST:
+        logger.info(f"Access granted: User {user_email} is a guest of Robot {robot_id}")
+        return True
+    logger.warning(f"Access denied: User {user_id} ({user_email}) has no access to Robot {robot_id}")
+    return False
+
+def user_robots_subquery(user_id: str, user_email: Optional[str], role: Optional[str] = None):
+    """(robot_id, nickname, role) rows for the user's owned and shared robots, as a subquery.
+    With role, only that side of the union is queried."""
+    queries = []
+    if role in (None, ROBOT_ROLE_OWNER):
+        queries.append(
+            select(
+                RobotOwnership.robot_id,
+                RobotOwnership.nickname,
+                literal(ROBOT_ROLE_OWNER).label("role"),
+            ).where(RobotOwnership.user_id == user_id)
+        )
+    if user_email and role in (None, ROBOT_ROLE_GUEST):
+        queries.append(
+            select(
+                RobotOwnership.robot_id,
+                RobotOwnership.nickname,
+                literal(ROBOT_ROLE_GUEST).label("role"),
+            )
+            .join(RobotSharedAccess, RobotOwnership.robot_id == RobotSharedAccess.robot_id)
+            .where(RobotSharedAccess.guest_email == user_email.lower())
+        )
+    if not queries:
+        # Guest listing for a user without an email: nothing can be shared with them.
+        queries.append(select(RobotOwnership.robot_id, RobotOwnership.nickname, literal(ROBOT_ROLE_GUEST).label("role")).where(false()))
+    return union_all(*queries).subquery() if len(queries) > 1 else queries[0].subquery()
+
+def _user_robots_query(user_id: str, user_email: Optional[str]):
+    combined = user_robots_subquery(user_id, user_email)
+    return select(combined.c.robot_id, combined.c.nickname, combined.c.role).order_by(
+        combined.c.role != ROBOT_ROLE_OWNER
+    )
+
+async def list_user_robots(user_id: str, user_email: Optional[str]) -> list[tuple[str, Optional[str], str]]:
     """
-    Queries Postgres to see if the user owns the robot OR has been granted access via email.
+    (robot_id, nickname, role) for every robot the user owns or that is shared with
+    their email, owned robots first, in one query. Shared robots carry the owner's nickname.
     """
     async with async_session() as session:
-        # Check ownership
-        owner_result = await session.execute(
-            select(RobotOwnership).where(
-                RobotOwnership.user_id == user_id,
-                RobotOwnership.robot_id == robot_id
-            )
-        )
-        if owner_result.scalar_one_or_none():
-            logger.info(f"Access granted: User {user_id} owns Robot {robot_id}")
-            return True
-            
-        # Check shared access via email
-        if user_email:
-            email_lower = user_email.lower()
-            share_result = await session.execute(
-                select(RobotSharedAccess).where(
-                    RobotSharedAccess.robot_id == robot_id,
-                    RobotSharedAccess.guest_email == email_lower
-                )
-            )
-            if share_result.scalar_one_or_none():
-                logger.info(f"Access granted: User {user_email} is a guest of Robot {robot_id}")
-                return True
-                
-        logger.warning(f"Access denied: User {user_id} ({user_email}) has no access to Robot {robot_id}")
-        return False
+        result = await session.execute(_user_robots_query(user_id, user_email))
+        return [tuple(row) for row in result.all()]
 
 async def validate_stream_auth(req, redis_conn, telemetry_manager) -> bool:
     """
@@ -251,12 +315,7 @@ async def validate_stream_auth(req, redis_conn, telemetry_manager) -> bool:
     robot_id = parts[1]
 
     if req.action == 'publish':
-        online = False
-        up_status = await redis_conn.hgetall(f"robot:{robot_id}:uplink_state")
-        if up_status and 'online' in up_status:
-            online = up_status['online'] == 'true'
-
-        if online:
+        if await telemetry_manager.is_robot_online(robot_id):
             logger.info(f"Stream Auth Success: Robot {robot_id} authorized to publish.")
             return True
         logger.warning(f"Stream Auth Failed: Robot {robot_id} may not publish video.")
@@ -270,23 +329,19 @@ async def validate_stream_auth(req, redis_conn, telemetry_manager) -> bool:
             return False
 
         ticket_id = query_params['ticket'][0]
+        # Signed tickets are checked in-process, without Redis (see tickets.py).
         ticket = await get_ticket(redis_conn, ticket_id)
 
         if not ticket or ticket.get('robot_id') != robot_id:
             logger.info(f'Rejecting stream auth: invalid ticket or robot_id mismatch for {robot_id}')
             return False
 
-        user_email = ticket.get('user_email', '').lower()
         user_id = ticket['user_id']
 
-        # Ticket is only valid while the user has an active /control connection.
-        connections = telemetry_manager.active_user_connections.get(robot_id, [])
-        user_is_connected = any(
-            telemetry_manager.user_email.get(ws, '').lower() == user_email
-            for ws in connections
-        )
-        if not user_is_connected:
-            logger.info(f'Rejecting stream auth: user {user_email} has no active connection to {robot_id}')
+        # Ticket is only valid while the user has an active /control connection (on any instance).
+        user_email = await telemetry_manager.presence.connected_email(robot_id, user_id)
+        if user_email is None or not ticket_email_matches(ticket, user_email):
+            logger.info(f'Rejecting stream auth: user {user_id} has no active connection to {robot_id}')
             return False
 
         # Re-check access in case it was revoked since the ticket was issued.
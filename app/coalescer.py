@@ -0,0 +1,92 @@
+import asyncio
+import logging
+import os
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+import betterproto2
+from nf_robot.generated.nf import telemetry
+
+from .outbound_queue import OutboundQueue, HIGH_RATE_FIELDS
+
+logger = logging.getLogger(__name__)
+
+# Default coalescing window for UI sockets, in milliseconds. 0 disables coalescing, so every
+# frame the robot sends is forwarded as-is. Viewers may pick their own window (see main.py).
+TELEMETRY_COALESCE_MS = int(os.getenv("TELEMETRY_COALESCE_MS", "0"))
+MAX_COALESCE_MS = 1000
+
+
+@lru_cache(maxsize=64)
+def _parse_batch(payload: bytes) -> telemetry.TelemetryBatchUpdate:
+    """Parse a frame once for all viewers of a robot. The result is shared, never mutate it."""
+    return telemetry.TelemetryBatchUpdate().parse(payload)
+
+
+class TelemetryCoalescer:
+    """
+    Merges high-rate telemetry for one viewer before it reaches the viewer's OutboundQueue.
+
+    Within each window only the latest item per oneof field (pos_estimate, grip_sensors,
+    last_commanded_vel, ...) is kept, and one merged TelemetryBatchUpdate is emitted when
+    the window closes. Anything else (conn status, pop_message, target_list, ...) is
+    forwarded immediately; a frame with nothing to merge is forwarded byte-for-byte.
+    """
+    def __init__(self, queue: OutboundQueue, robot_id: str, window_ms: int):
+        self.queue = queue
+        self.robot_id = robot_id
+        self.window = window_ms / 1000.0
+        self.pending: Dict[str, telemetry.TelemetryItem] = {}  # oneof field name -> latest item
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def depth(self) -> int:
+        return self.queue.depth
+
+    @property
+    def dropped(self) -> int:
+        return self.queue.dropped
+
+    async def drained(self) -> bool:
+        return await self.queue.drained()
+
+    def stop(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        self.queue.stop()
+
+    def put(self, payload: bytes):
+        try:
+            batch = _parse_batch(payload)
+        except Exception:
+            # Not ours to judge; let the UI deal with it exactly as before.
+            self.queue.put(payload)
+            return
+
+        passthrough: List[telemetry.TelemetryItem] = []
+        merged_any = False
+        for item in batch.updates:
+            field_name, _ = betterproto2.which_one_of(item, "payload")
+            # Retained high-rate items merge too: Redis keeps the latest one for new viewers regardless.
+            if field_name in HIGH_RATE_FIELDS:
+                self.pending[field_name] = item
+                merged_any = True
+            else:
+                passthrough.append(item)
+
+        if not merged_any:
+            self.queue.put(payload)
+            return
+        if passthrough:
+            self.queue.put(bytes(telemetry.TelemetryBatchUpdate(robot_id=batch.robot_id, updates=passthrough)))
+        if self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.window, self._flush)
+
+    def _flush(self):
+        self._flush_handle = None
+        if not self.pending:
+            return
+        merged = telemetry.TelemetryBatchUpdate(robot_id=self.robot_id, updates=list(self.pending.values()))
+        self.pending = {}
+        self.queue.put(bytes(merged))
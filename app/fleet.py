@@ -0,0 +1,191 @@
+import asyncio
+import base64
+import json
+import logging
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, List, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import and_, or_, select, tuple_
+
+from .auth import user_robots_subquery
+from .database import async_session, RobotActivity, count_recently_active_robots
+
+logger = logging.getLogger(__name__)
+
+FLEET_PAGE_MAX = 200
+# Online status lives in Redis, not Postgres: filtering by it reads SQL pages of this many
+# rows, at most FLEET_STATUS_SCAN_PAGES of them per request.
+FLEET_STATUS_SCAN_ROWS = FLEET_PAGE_MAX
+FLEET_STATUS_SCAN_PAGES = 5
+
+
+def encode_cursor(last_seen: Optional[datetime], robot_id: str, role: str) -> str:
+    key = [last_seen.isoformat() if last_seen else None, robot_id, role]
+    return base64.urlsafe_b64encode(json.dumps(key).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        last_seen, robot_id, role = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return (datetime.fromisoformat(last_seen) if last_seen else None), str(robot_id), str(role)
+    except (ValueError, TypeError, UnicodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _escape_like(prefix: str) -> str:
+    return prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+async def list_fleet_page(
+    user_id: str,
+    user_email: str,
+    limit: int,
+    cursor: Optional[str] = None,
+    role: Optional[str] = None,
+    nickname_prefix: Optional[str] = None,
+) -> tuple[list, Optional[str]]:
+    """
+    One page of the user's robots, most recently seen first (never-seen robots last),
+    as (robot_id, nickname, role, last_seen) rows plus the cursor for the next page.
+
+    Keyset pagination on (last_seen DESC NULLS LAST, robot_id, role): each page starts
+    right after the previous page's last row, so deep pages cost the same as the first.
+    """
+    fleet = user_robots_subquery(user_id, user_email, role)
+    last_seen = RobotActivity.last_seen
+    stmt = (
+        select(fleet.c.robot_id, fleet.c.nickname, fleet.c.role, last_seen)
+        .select_from(fleet.outerjoin(RobotActivity, RobotActivity.robot_id == fleet.c.robot_id))
+        .order_by(last_seen.desc().nulls_last(), fleet.c.robot_id, fleet.c.role)
+        .limit(limit + 1)
+    )
+    if nickname_prefix:
+        stmt = stmt.where(fleet.c.nickname.ilike(f"{_escape_like(nickname_prefix)}%", escape="\\"))
+    if cursor:
+        after_seen, after_robot, after_role = decode_cursor(cursor)
+        after_key = tuple_(fleet.c.robot_id, fleet.c.role) > tuple_(after_robot, after_role)
+        if after_seen is None:
+            stmt = stmt.where(last_seen.is_(None), after_key)
+        else:
+            stmt = stmt.where(or_(
+                last_seen < after_seen,
+                and_(last_seen == after_seen, after_key),
+                last_seen.is_(None),
+            ))
+
+    async with async_session() as session:
+        rows = [tuple(row) for row in (await session.execute(stmt)).all()]
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        robot_id, _, row_role, row_seen = rows[-1]
+        next_cursor = encode_cursor(row_seen, robot_id, row_role)
+    return rows, next_cursor
+
+
+async def list_fleet_page_by_status(
+    user_id: str,
+    user_email: str,
+    limit: int,
+    online: bool,
+    online_flags: Callable[[List[str]], Awaitable[List[bool]]],
+    cursor: Optional[str] = None,
+    role: Optional[str] = None,
+    nickname_prefix: Optional[str] = None,
+) -> tuple[list, Optional[str]]:
+    """
+    Like list_fleet_page, but only robots whose online status (per online_flags, one
+    ZMSCORE per SQL page) equals online. Rows are scanned in SQL order until the page is
+    full; after FLEET_STATUS_SCAN_PAGES pages the page is returned short, possibly empty,
+    with a next_cursor to continue from, so one request never walks a whole large fleet.
+    """
+    matched = []
+    for _ in range(FLEET_STATUS_SCAN_PAGES):
+        rows, cursor = await list_fleet_page(
+            user_id, user_email, FLEET_STATUS_SCAN_ROWS,
+            cursor=cursor, role=role, nickname_prefix=nickname_prefix,
+        )
+        for i, (row, is_online) in enumerate(zip(rows, await online_flags([row[0] for row in rows]))):
+            if is_online != online:
+                continue
+            matched.append(row)
+            if len(matched) == limit:
+                if i < len(rows) - 1:
+                    robot_id, _, row_role, row_seen = row
+                    cursor = encode_cursor(row_seen, robot_id, row_role)
+                return matched, cursor
+        if cursor is None:
+            break
+    return matched, cursor
+
+
+# The deployed-fleet count on the public scoreboard is recomputed at most this often.
+ACTIVE_COUNT_REFRESH_SECONDS = 300
+ACTIVE_COUNT_WINDOW_MONTHS = 3
+ACTIVE_COUNT_KEY = "fleet:active_count"
+ACTIVE_COUNT_LOCK_KEY = "fleet:active_count:lock"
+ACTIVE_COUNT_LOCK_SECONDS = 30
+
+
+class ActiveCountCache:
+    """
+    Stale-while-revalidate cache of count_recently_active_robots for the public scoreboard.
+
+    Each instance answers from memory. Once the value is older than the refresh interval,
+    the stale value is still served while one background refresh runs. The refresh first
+    reads the shared summary in Redis ('fleet:active_count', count plus when it was
+    computed); only if that is stale too does one instance, holding a short lock, run the
+    COUNT(*) in Postgres and publish the new summary. A scoreboard traffic spike therefore
+    reaches Postgres at most once per refresh interval for the whole deployment.
+    """
+    def __init__(self):
+        self.count: Optional[int] = None
+        self.fetched_at = 0.0
+        self._refresh: Optional[asyncio.Task] = None
+
+    async def get(self, redis_conn) -> int:
+        if self.count is None:
+            await self._start_refresh(redis_conn)
+        elif time.monotonic() - self.fetched_at > ACTIVE_COUNT_REFRESH_SECONDS:
+            self._start_refresh(redis_conn)  # serve the stale value meanwhile
+        return self.count
+
+    def _start_refresh(self, redis_conn) -> asyncio.Task:
+        if self._refresh is None or self._refresh.done():
+            self._refresh = asyncio.create_task(self._load(redis_conn))
+        return self._refresh
+
+    async def _read_summary(self, redis_conn) -> Optional[dict]:
+        summary = await redis_conn.get(ACTIVE_COUNT_KEY)
+        return json.loads(summary) if summary else None
+
+    async def _load(self, redis_conn):
+        try:
+            cached = await self._read_summary(redis_conn)
+            if cached is None or time.time() - cached["computed_at"] > ACTIVE_COUNT_REFRESH_SECONDS:
+                # One instance recomputes; the others keep the previous summary, or on a
+                # cold start wait for the one being computed.
+                if await redis_conn.set(ACTIVE_COUNT_LOCK_KEY, "1", nx=True, ex=ACTIVE_COUNT_LOCK_SECONDS):
+                    cached = {
+                        "count": await count_recently_active_robots(months=ACTIVE_COUNT_WINDOW_MONTHS),
+                        "computed_at": time.time(),
+                    }
+                    await redis_conn.set(ACTIVE_COUNT_KEY, json.dumps(cached))
+                    await redis_conn.delete(ACTIVE_COUNT_LOCK_KEY)
+                deadline = time.monotonic() + ACTIVE_COUNT_LOCK_SECONDS
+                while cached is None and time.monotonic() < deadline:
+                    await asyncio.sleep(0.1)
+                    cached = await self._read_summary(redis_conn)
+                if cached is None:
+                    raise RuntimeError("no active robot count was published")
+            self.count = cached["count"]
+            self.fetched_at = time.monotonic()
+        except Exception as e:
+            if self.count is None:
+                raise
+            logger.warning(f"Could not refresh the active robot count, serving the previous value: {e}")
+
+
+active_count_cache = ActiveCountCache()
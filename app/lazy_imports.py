@@ -0,0 +1,64 @@
+"""
+Heavy SDKs that most requests never touch, imported on first use instead of with app.main.
+
+Importing firebase_admin pulls in google-auth, requests and urllib3, and stripe its own
+HTTP stack: a large share of a serverless cold start that the first request would
+otherwise wait for. The lifespan warms these in a background thread once the app is
+serving (see warm_up), so in practice the first request that needs one rarely pays for
+it either.
+
+Measure the effect with benchmarks/import_budget.py.
+"""
+import importlib
+import logging
+import threading
+from types import ModuleType
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class LazyModule:
+    """Stands in for a module; the first attribute access imports it (and runs on_import once)."""
+    def __init__(self, name: str, on_import: Optional[Callable[[ModuleType], None]] = None):
+        self._name = name
+        self._on_import = on_import
+        self._module: Optional[ModuleType] = None
+        self._lock = threading.Lock()
+
+    def load(self) -> ModuleType:
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    module = importlib.import_module(self._name)
+                    if self._on_import:
+                        self._on_import(module)
+                    self._module = module
+        return self._module
+
+    def __getattr__(self, attr: str):
+        return getattr(self.load(), attr)
+
+
+def _initialize_firebase(_auth_module: ModuleType):
+    # On Cloud Run, this automatically uses the default service account.
+    import firebase_admin
+    try:
+        firebase_admin.get_app()
+    except ValueError:
+        firebase_admin.initialize_app()
+
+
+firebase_auth = LazyModule("firebase_admin.auth", on_import=_initialize_firebase)
+stripe = LazyModule("stripe")
+
+LAZY_MODULES = (firebase_auth, stripe)
+
+
+def warm_up():
+    """Import every lazy module now; meant to run off the event loop once the app is up."""
+    for module in LAZY_MODULES:
+        try:
+            module.load()
+        except Exception as e:
+            logger.error(f"Could not load {module._name}: {e}")
@@ -1,6 +1,9 @@
+import asyncio
 import os
 import json
 import logging
+import signal
+from contextlib import asynccontextmanager
 from typing import Optional, Annotated
 from datetime import date
 import time
@@ -14,14 +17,18 @@ from pydantic import BaseModel, EmailStr
 from sqlalchemy import select, delete
 from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
-import httpx
 
 from .telemetry_manager import telemetry_manager
+from .upstreams import staging_upstream, huggingface_upstream, UPSTREAMS, STAGING_CONTROL_PLANE_URL
+from .sdk_calls import firebase_calls, stripe_calls
+from .fleet import list_fleet_page, list_fleet_page_by_status, FLEET_PAGE_MAX, active_count_cache, ACTIVE_COUNT_WINDOW_MONTHS
+from .coalescer import TELEMETRY_COALESCE_MS, MAX_COALESCE_MS
 from .auth import (
     verify_google_token,
     validate_stream_auth,
     check_robot_ownership,
     check_robot_access,
+    list_user_robots,
     require_employee,
     require_admin,
     get_user_roles,
@@ -31,11 +38,14 @@ from .auth import (
     grant_role,
     revoke_role,
 )
-from .tickets import create_ticket, get_ticket, delete_user_robot_tickets
+from .tickets import create_ticket, get_ticket
+from .access_cache import access_cache
 from .queue_manager import queue_manager
-from .simulation_manager import simulation_manager
+from .lazy_imports import warm_up
 from .database import (
     init_db,
+    close_db,
+    robot_seen_writer,
     get_db,
     RobotOwnership,
     RobotSharedAccess,
@@ -43,7 +53,6 @@ from .database import (
     UserRole,
     VALID_ROLES,
     MetricMeasurement,
-    count_recently_active_robots,
 )
 from .metrics import METRIC_DEFINITIONS, METRIC_KEYS
 from .product_loader import load_product, SLUG_REDIRECTS
@@ -67,11 +76,77 @@ HF_CLIENT_SECRET = os.environ.get("HF_CLIENT_SECRET", "")
 # This must exactly match the redirect URI registered in Hugging Face developer settings
 HF_REDIRECT_URI = os.environ.get("HF_REDIRECT_URI", "https://neufangled.com/hf-redirect")
 
-# When set (prod only), auth requests containing staging=1 are forwarded here instead of being handled locally.
-STAGING_CONTROL_PLANE_URL = os.environ.get("STAGING_CONTROL_PLANE_URL", "")
+# How long websockets get to hand over after SIGTERM. Cloud Run kills the container 10s after it.
+SHUTDOWN_GRACE_SECONDS = float(os.getenv("SHUTDOWN_GRACE_SECONDS", "8"))
+# The loop only keeps weak references to tasks, so the SIGTERM drain is held here until it ends.
+_drain_tasks: set[asyncio.Task] = set()
+
+
+def drain_on_sigterm():
+    """
+    Drain websockets as soon as SIGTERM arrives, then hand the signal on to uvicorn.
+    uvicorn drops open websockets when it starts shutting down, before the lifespan's
+    shutdown half runs, so draining there would be too late.
+    """
+    loop = asyncio.get_running_loop()
+    previous = signal.getsignal(signal.SIGTERM)
+
+    async def drain_then_exit(sig, frame):
+        try:
+            await telemetry_manager.drain(SHUTDOWN_GRACE_SECONDS)
+        finally:
+            signal.signal(signal.SIGTERM, previous)
+            if callable(previous):
+                previous(sig, frame)
+            else:
+                signal.raise_signal(sig)
+
+    def start_drain(sig, frame):
+        task = asyncio.ensure_future(drain_then_exit(sig, frame))
+        _drain_tasks.add(task)
+        task.add_done_callback(_drain_tasks.discard)
+
+    def handle_sigterm(sig, frame):
+        loop.call_soon_threadsafe(start_drain, sig, frame)
+
+    try:
+        signal.signal(signal.SIGTERM, handle_sigterm)
+    except ValueError:
+        pass  # not the main thread, e.g. under a test client
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Redis and Postgres don't depend on each other, so connect to both at once.
+    # init_db creates missing tables and indexes only when RUN_DB_MIGRATIONS is set.
+    await asyncio.gather(telemetry_manager.connect(), queue_manager.connect(), init_db())
+    robot_seen_writer.start()
+    for upstream in UPSTREAMS:
+        upstream.start()
+    drain_on_sigterm()
+    # Load the SDKs deferred at import time off the event loop, now that requests are being served.
+    asyncio.get_running_loop().run_in_executor(None, warm_up)
+    yield
+    # Already done on SIGTERM; this covers other ways of stopping.
+    await telemetry_manager.drain(SHUTDOWN_GRACE_SECONDS)
+    # Each close runs even if one before it fails, so Redis and the DB pool are always released.
+    closers = [
+        ("robot activity writer", robot_seen_writer.close),  # flushes the last few seconds of robot activity
+        *((f"upstream {upstream.name}", upstream.close) for upstream in UPSTREAMS),
+        ("telemetry manager", telemetry_manager.close),
+        ("queue manager", queue_manager.close),
+        ("database", close_db),
+    ]
+    for name, close in closers:
+        try:
+            await close()
+        except Exception as e:
+            logger.error(f"Shutdown: closing {name} failed: {e}")
+
 
 app = FastAPI(
     title="Neufangled Control Plane",
+    lifespan=lifespan,
     openapi_url=None,
     docs_url=None, 
     redoc_url=None,
@@ -87,12 +162,6 @@ app.add_middleware(
 
 token_auth_scheme = HTTPBearer()
 
-@app.on_event("startup")
-async def startup_event():
-    await telemetry_manager.connect()
-    # Create the SQL tables on the VM database if they don't exist
-    await init_db()
-
 # --- STATIC FILE SERVING ---
 
 # Define where the static files live in the container
@@ -211,12 +280,7 @@ async def media_server_auth(req: StreamAuthRequest):
     """
     if "staging=1" in req.query and STAGING_CONTROL_PLANE_URL:
         try:
-            async with httpx.AsyncClient() as client:
-                resp = await client.post(
-                    f"{STAGING_CONTROL_PLANE_URL}/internal/auth",
-                    json=req.model_dump(),
-                    timeout=10.0
-                )
+            resp = await staging_upstream.post("/internal/auth", json=req.model_dump())
             if resp.status_code == 200:
                 return {"status": "OK"}
         except Exception as e:
@@ -241,6 +305,10 @@ async def robot_websocket_endpoint(
    - Subscribe to 'commands:{robot_id}' Redis channel to forward to hardware.
     """
     await websocket.accept()
+    if telemetry_manager.draining:
+        # This instance is shutting down; reconnect to another one.
+        await websocket.close(code=1012)
+        return
 
     try:
         logger.info(f"Robot {robot_id} connected via WebSocket")
@@ -260,13 +328,21 @@ async def ui_websocket_endpoint(
     websocket: WebSocket,
     robot_id: str,
     ticket: Optional[str] = None,
+    coalesce_ms: Optional[int] = None,
+    replay_from: Optional[str] = None,
 ):
     """
     Endpoint where web based robot ui connects to send controls and receive telemetry messages.
        - Subscribe to 'state:{robot_id}' Redis channel to get updates.
        - If Playroom: Check Queue Manager. If Driver, allow writes to 'commands:{robot_id}'.
+       - coalesce_ms (optional): merge high-rate telemetry into one batch per window, for viewers on slow links.
+       - replay_from (optional, streams transport only): resend frames recorded after this stream ID / ms timestamp.
     """
     await websocket.accept()
+    if telemetry_manager.draining:
+        # This instance is shutting down; reconnect to another one.
+        await websocket.close(code=1012)
+        return
 
     # Token must be in the Authorization header; query-param tokens are no longer accepted.
     token: Optional[str] = None
@@ -304,7 +380,12 @@ async def ui_websocket_endpoint(
             return
 
         logger.info(f"User {user_id} authorized for robot {robot_id}")
-        await telemetry_manager.handle_user_connection(websocket, robot_id, user_id, user_email or "")
+        if coalesce_ms is None:
+            coalesce_ms = TELEMETRY_COALESCE_MS
+        coalesce_ms = max(0, min(coalesce_ms, MAX_COALESCE_MS))
+        await telemetry_manager.handle_user_connection(
+            websocket, robot_id, user_id, user_email or "", coalesce_ms, replay_from
+        )
 
     except WebSocketDisconnect:
         logger.info(f"Client disconnected from {robot_id}")
@@ -315,10 +396,6 @@ async def ui_websocket_endpoint(
         await websocket.close(code=1011)
         raise e  # raise so trace can be seen in logs
 
-    finally:
-        if user_id:
-            await delete_user_robot_tickets(telemetry_manager.decoding_redis, user_id, robot_id)
-
 
 @app.websocket("/simulated/{model}")
 async def simulator(
@@ -330,7 +407,9 @@ async def simulator(
     Telemetry updates from a simluated robot are sent as long as the connection is open.
     """
     await websocket.accept()
-    
+    # The simulator (and numpy) is only loaded once someone opens it.
+    from .simulation_manager import simulation_manager
+
     try:
         await simulation_manager.handle_user_connection(websocket)        
     except Exception as e:
@@ -360,6 +439,7 @@ async def bind_robot(
             # If the user already owns it, we allow them to update the nickname
             ownership.nickname = nickname
             await db.commit()
+            await access_cache.invalidate(robot_id)  # cached /listrobots rows carry the nickname
             return {"status": "nickname_updated", "nickname": nickname}
         raise HTTPException(status_code=403, detail="Robot is owned by another user")
 
@@ -367,6 +447,7 @@ async def bind_robot(
     new_owner = RobotOwnership(user_id=user_id, robot_id=robot_id, nickname=nickname)
     db.add(new_owner)
     await db.commit()
+    await access_cache.invalidate(robot_id)
     
     return {"status": "bound", "robot_id": robot_id, "nickname": nickname}
 
@@ -398,6 +479,7 @@ async def unbind_robot(
         raise HTTPException(status_code=404, detail="Robot not found")
 
     await db.commit()
+    await access_cache.invalidate(robot_id)
     return {"status": "unbound", "robot_id": robot_id}
 
 
@@ -469,6 +551,7 @@ async def share_robot(
     )
     db.add(new_share)
     await db.commit()
+    await access_cache.invalidate(robot_id)
 
     return {"status": "shared", "guest_email": guest_email_lower}
 
@@ -497,8 +580,8 @@ async def revoke_robot_access(
     if result.rowcount == 0:
         raise HTTPException(status_code=404, detail="Share record not found")
 
-    # Boot the user if they're currently connected, across all server instances
-    await telemetry_manager.pub_redis.publish(f"revoke:{guest_email.lower()}", robot_id.encode())
+    # Drop cached access decisions and boot the user if they're currently connected, across all server instances
+    await access_cache.invalidate(robot_id, revoked_email=guest_email)
 
     return {"status": "revoked", "guest_email": guest_email}
 
@@ -525,50 +608,78 @@ async def list_shared_users(
 @app.get("/listrobots")
 async def list_robots(
     creds: Annotated[HTTPAuthorizationCredentials, Depends(token_auth_scheme)],
-    db: AsyncSession = Depends(get_db)
 ):
     """Returns robots owned by OR shared with the logged-in user."""
     user_token = await verify_google_token(creds.credentials)
     user_id = user_token["uid"]
     user_email = user_token.get("email", "").lower()
 
-    # Fetch strictly owned robots
-    owned_res = await db.execute(
-        select(RobotOwnership).where(RobotOwnership.user_id == user_id)
-    )
-    owned_bots = owned_res.scalars().all()
-
-    # Fetch robots shared with this user's email
-    shared_bots = []
-    if user_email:
-        # Join against RobotOwnership to get the nickname set by the owner
-        shared_res = await db.execute(
-            select(RobotOwnership)
-            .join(RobotSharedAccess, RobotOwnership.robot_id == RobotSharedAccess.robot_id)
-            .where(RobotSharedAccess.guest_email == user_email)
-        )
-        shared_bots = shared_res.scalars().all()
+    # Owned and shared robots, each tagged with the user's role, in one query (cached per user)
+    robots = await access_cache.robot_list(user_id, user_email, lambda: list_user_robots(user_id, user_email))
 
-    bots_with_status = []
-    
-    async def append_bot_data(bot, role):
-        up_status = await telemetry_manager.decoding_redis.hgetall(f"robot:{bot.robot_id}:uplink_state")
-        is_online = up_status.get('online') == 'true' if up_status else False
-        bots_with_status.append({
-            'robotid': bot.robot_id,
-            'nickname': bot.nickname or "Unnamed Robot",
-            'online': is_online,
-            'role': role # Frontend can use this to disable the "Unbind" or "Share" UI buttons
-        })
+    # Every robot's online flag from the heartbeat index, in one command
+    online_flags = await telemetry_manager.online_flags([robot_id for robot_id, _, _ in robots])
 
-    for b in owned_bots:
-        await append_bot_data(b, "owner")
-        
-    for b in shared_bots:
-        await append_bot_data(b, "guest")
+    bots_with_status = [
+        {
+            'robotid': robot_id,
+            'nickname': nickname or "Unnamed Robot",
+            'online': online,
+            'role': role # Frontend can use this to disable the "Unbind" or "Share" UI buttons
+        }
+        for (robot_id, nickname, role), online in zip(robots, online_flags)
+    ]
 
     return {'bots': bots_with_status}
 
+@app.get("/fleet")
+async def list_fleet(
+    creds: Annotated[HTTPAuthorizationCredentials, Depends(token_auth_scheme)],
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    online: Optional[bool] = None,
+    role: Optional[str] = None,
+    nickname_prefix: Optional[str] = None,
+):
+    """
+    Paginated /listrobots for large fleets: the user's robots, most recently seen first.
+    Filters by online status, role ('owner' / 'guest') and nickname prefix. Pass the
+    returned next_cursor back as cursor to get the following page; with the online
+    filter a page can hold fewer than limit robots before the end of the fleet.
+    """
+    user_token = await verify_google_token(creds.credentials)
+    user_id = user_token["uid"]
+    user_email = user_token.get("email", "").lower()
+
+    if role not in (None, "owner", "guest"):
+        raise HTTPException(status_code=400, detail="role must be 'owner' or 'guest'")
+    limit = max(1, min(limit, FLEET_PAGE_MAX))
+
+    if online is not None:
+        rows, next_cursor = await list_fleet_page_by_status(
+            user_id, user_email, limit, online, telemetry_manager.online_flags,
+            cursor=cursor, role=role, nickname_prefix=nickname_prefix,
+        )
+        online_flags = [online] * len(rows)
+    else:
+        rows, next_cursor = await list_fleet_page(
+            user_id, user_email, limit,
+            cursor=cursor, role=role, nickname_prefix=nickname_prefix,
+        )
+        online_flags = await telemetry_manager.online_flags([row[0] for row in rows])
+
+    bots = [
+        {
+            'robotid': robot_id,
+            'nickname': nickname or "Unnamed Robot",
+            'online': is_online,
+            'role': robot_role,
+            'last_seen': last_seen.isoformat() if last_seen else None,
+        }
+        for (robot_id, nickname, robot_role, last_seen), is_online in zip(rows, online_flags)
+    ]
+    return {'bots': bots, 'next_cursor': next_cursor}
+
 # --- OAuth & Hugging Face Integrations ---
 
 @app.post("/huggingface/exchange_code")
@@ -586,32 +697,31 @@ async def huggingface_exchange_code(
     user_id = user_token["uid"]
 
     # Exchange the code for an Access Token
-    async with httpx.AsyncClient() as client:
-        token_res = await client.post("https://huggingface.co/oauth/token", data={
-            "grant_type": "authorization_code",
-            "client_id": HF_CLIENT_ID,
-            "client_secret": HF_CLIENT_SECRET,
-            "code": req.code,
-            "redirect_uri": HF_REDIRECT_URI
-        })
+    token_res = await huggingface_upstream.post("/oauth/token", data={
+        "grant_type": "authorization_code",
+        "client_id": HF_CLIENT_ID,
+        "client_secret": HF_CLIENT_SECRET,
+        "code": req.code,
+        "redirect_uri": HF_REDIRECT_URI
+    })
+    
+    if token_res.status_code != 200:
+        logger.error(f"HF Token Exchange Failed: {token_res.text}")
+        raise HTTPException(status_code=400, detail="Invalid or expired authorization code.")
         
-        if token_res.status_code != 200:
-            logger.error(f"HF Token Exchange Failed: {token_res.text}")
-            raise HTTPException(status_code=400, detail="Invalid or expired authorization code.")
-            
-        token_data = token_res.json()
-        hf_access_token = token_data.get("access_token")
-
-        # Fetch the user's Hugging Face username using their new token
-        whoami_res = await client.get(
-            "https://huggingface.co/api/whoami-v2", 
-            headers={"Authorization": f"Bearer {hf_access_token}"}
-        )
+    token_data = token_res.json()
+    hf_access_token = token_data.get("access_token")
+
+    # Fetch the user's Hugging Face username using their new token
+    whoami_res = await huggingface_upstream.get(
+        "/api/whoami-v2", 
+        headers={"Authorization": f"Bearer {hf_access_token}"}
+    )
+    
+    if whoami_res.status_code != 200:
+        raise HTTPException(status_code=500, detail="Failed to fetch Hugging Face profile data.")
         
-        if whoami_res.status_code != 200:
-            raise HTTPException(status_code=500, detail="Failed to fetch Hugging Face profile data.")
-            
-        hf_username = whoami_res.json().get("name")
+    hf_username = whoami_res.json().get("name")
 
     # Store the token and username in the database
     # Check if a record exists for this Firebase user
@@ -767,11 +877,12 @@ async def metrics_all(db: AsyncSession = Depends(get_db)):
 @app.get("/api/fleet/active_count")
 async def fleet_active_count():
     """Public: number of distinct robots seen online in the last 3 months — the
-    'deployed' fleet size shown on the scoreboard hero."""
-    count = await count_recently_active_robots(months=3)
+    'deployed' fleet size shown on the scoreboard hero — and how many are online now."""
+    count = await active_count_cache.get(telemetry_manager.decoding_redis)
     # plus additional robots which are known to be deployed in lan mode by testers
     count += 4
-    return {"active_count": count, "window_months": 3}
+    online_count = await telemetry_manager.online_count()
+    return {"active_count": count, "window_months": ACTIVE_COUNT_WINDOW_MONTHS, "online_count": online_count}
 
 
 @app.post("/api/metrics")
@@ -830,7 +941,7 @@ async def admin_list_users(admin: Annotated[dict, Depends(require_admin)]):
     """Every user that holds at least one role, with emails resolved for display.
     Sorted by email so the roster reads naturally in the admin table."""
     roles_by_user = await list_user_roles()
-    emails = emails_for_uids(list(roles_by_user.keys()))
+    emails = await emails_for_uids(list(roles_by_user.keys()))
     users = [
         {"user_id": uid, "email": emails.get(uid), "roles": sorted(roles)}
         for uid, roles in roles_by_user.items()
@@ -846,7 +957,7 @@ async def admin_lookup_user(
 ):
     """Resolve an email to its Firebase user so an admin can grant a first role.
     Returns the user's current roles (empty if none). 404 if no such user."""
-    resolved = resolve_email_to_user(email)
+    resolved = await resolve_email_to_user(email)
     if not resolved:
         raise HTTPException(status_code=404, detail="No Firebase user with that email.")
     uid, resolved_email = resolved
@@ -890,6 +1001,24 @@ async def admin_revoke_role(
     return {"status": "revoked", "user_id": req.user_id, "role": req.role}
 
 
+@app.get("/admin/upstreams")
+async def admin_upstream_stats(admin: Annotated[dict, Depends(require_admin)]):
+    """Connection reuse, latency and circuit state for each external HTTP service and SDK."""
+    return {
+        "http": {upstream.name: upstream.stats() for upstream in UPSTREAMS},
+        "sdk": {executor.name: executor.stats() for executor in (firebase_calls, stripe_calls)},
+    }
+
+
+@app.get("/admin/telemetry")
+async def admin_telemetry_stats(admin: Annotated[dict, Depends(require_admin)]):
+    """Robot ingest cost and, per viewer, outbound queue depth and dropped frames on this instance."""
+    return {
+        "ingest": telemetry_manager.ingest_counters.per_frame(),
+        "viewers": telemetry_manager.outbound_stats(),
+    }
+
+
 # by putting this at the end, it is matched with a lower priority.
 @app.get("/{page_name}")
 async def read_page(request: Request, page_name: str):
@@ -0,0 +1,178 @@
+import asyncio
+import logging
+import os
+from collections import deque
+from typing import Deque, Optional, Tuple
+
+from fastapi import WebSocket
+from nf_robot.generated.nf import telemetry
+
+from .telemetry_wire import ITEM_RETAIN_KEY, iter_fields, iter_items
+
+logger = logging.getLogger(__name__)
+
+# Frame priorities, lowest first. When a viewer's queue is full, the oldest frame of the
+# lowest droppable priority is evicted to make room.
+PRIORITY_HIGH_RATE = 0  # only continuously refreshed items; the next frame supersedes it
+PRIORITY_NORMAL = 1     # one-shot items that are nice to have but not essential
+PRIORITY_PROTECTED = 2  # retained items and connection status; never dropped
+
+# TelemetryItem payloads the robot re-sends many times a second.
+HIGH_RATE_FIELDS = frozenset({
+    "pos_estimate",
+    "pos_factors_debug",
+    "gantry_sightings",
+    "vid_stats",
+    "last_commanded_vel",
+    "raw_commanded_vel",
+    "grip_sensors",
+    "grip_cam_preditions",
+    "swing_cancellation_state",
+    "visibility_states",
+})
+
+# TelemetryItem payloads a viewer must never miss, even when retain_key is not set.
+PROTECTED_FIELDS = frozenset({
+    "new_anchor_poses",
+    "component_conn_status",
+    "uplink_status",
+    "video_ready",
+    "pop_message",
+})
+
+# Drop policies, by name. Each maps to the highest priority that may be evicted.
+#   high_rate:     only evict frames made entirely of high-rate items (default)
+#   non_protected: evict high-rate frames first, then any frame without protected items
+DROP_POLICIES = {
+    "high_rate": PRIORITY_HIGH_RATE,
+    "non_protected": PRIORITY_NORMAL,
+}
+
+# Frames buffered per viewer before the drop policy kicks in. At ~30 Hz this is about two
+# seconds of backlog, after which the viewer is better served by fresh frames than old ones.
+TELEMETRY_QUEUE_MAX = int(os.getenv("TELEMETRY_QUEUE_MAX", "64"))
+TELEMETRY_DROP_POLICY = os.getenv("TELEMETRY_DROP_POLICY", "high_rate")
+
+
+# The same sets as TelemetryItem payload field numbers, for classifying frames by tag scan.
+_ITEM_FIELD_NAMES = telemetry.TelemetryItem._betterproto.field_name_by_number
+_HIGH_RATE_NUMBERS = frozenset(n for n, name in _ITEM_FIELD_NAMES.items() if name in HIGH_RATE_FIELDS)
+_PROTECTED_NUMBERS = frozenset(n for n, name in _ITEM_FIELD_NAMES.items() if name in PROTECTED_FIELDS)
+
+
+def frame_priority(payload: bytes) -> int:
+    """
+    Classify a serialized TelemetryBatchUpdate by its most important item. Walks the
+    tags (see telemetry_wire) rather than parsing the frame, since it runs on every put().
+    """
+    priority = PRIORITY_HIGH_RATE
+    try:
+        for item in iter_items(payload):
+            payload_field = None
+            retained = False
+            for field_number, _, _, _ in iter_fields(item):
+                if field_number == ITEM_RETAIN_KEY:
+                    retained = True
+                else:
+                    payload_field = field_number  # oneof: the last one on the wire wins
+            if payload_field in _HIGH_RATE_NUMBERS:
+                # Robots retain their latest pos_estimate etc. too, but a newer frame always
+                # supersedes it and new viewers get it from Redis, so it stays droppable.
+                continue
+            if payload_field in _PROTECTED_NUMBERS or retained:
+                return PRIORITY_PROTECTED
+            priority = PRIORITY_NORMAL
+    except ValueError:
+        return PRIORITY_PROTECTED
+    return priority
+
+
+class OutboundQueue:
+    """
+    Bounded outbound buffer for one UI websocket, drained by a dedicated writer task.
+
+    put() never blocks, so the Redis listener can hand a frame to every viewer without
+    waiting on any of them. A slow viewer only ever delays itself: once its queue is full,
+    frames are evicted according to the drop policy, oldest first.
+    """
+    def __init__(self, websocket: WebSocket, maxsize: int = TELEMETRY_QUEUE_MAX, drop_policy: str = TELEMETRY_DROP_POLICY):
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f"Unknown telemetry drop policy: {drop_policy}")
+        self.websocket = websocket
+        self.maxsize = maxsize
+        self.max_drop_priority = DROP_POLICIES[drop_policy]
+        self.frames: Deque[Tuple[int, bytes]] = deque()  # (priority, payload)
+        self.dropped = 0
+        self._ready = asyncio.Event()
+        self._idle = asyncio.Event()  # set while nothing is queued, or once the writer has stopped
+        self._idle.set()
+        self.closed = False
+        self.writer_task: Optional[asyncio.Task] = None
+
+    @property
+    def depth(self) -> int:
+        return len(self.frames)
+
+    def start(self):
+        self.writer_task = asyncio.create_task(self._write_loop())
+
+    def stop(self):
+        if self.writer_task is not None:
+            self.writer_task.cancel()
+            self.writer_task = None
+        self.closed = True
+        self._idle.set()
+
+    def put(self, payload: bytes):
+        priority = frame_priority(payload)
+        if len(self.frames) >= self.maxsize and not self._make_room(priority):
+            self._count_drop()
+            return
+        self.frames.append((priority, payload))
+        self._idle.clear()
+        self._ready.set()
+
+    async def drained(self) -> bool:
+        """
+        Wait until the writer has sent everything queued so far, for producers that can
+        afford to wait (see TelemetryManager._replay). False if the writer has stopped.
+        """
+        await self._idle.wait()
+        return not self.closed
+
+    def _make_room(self, incoming_priority: int) -> bool:
+        """
+        Evict one queued frame for the incoming one. Returns False if the incoming frame
+        should be dropped instead. Protected frames are always accepted, even over the
+        bound, since they are rare and losing them leaves the UI in a wrong state.
+        """
+        for priority in range(self.max_drop_priority + 1):
+            for i, (queued_priority, _) in enumerate(self.frames):
+                if queued_priority == priority:
+                    del self.frames[i]
+                    self._count_drop()
+                    return True
+        return incoming_priority > self.max_drop_priority
+
+    def _count_drop(self):
+        self.dropped += 1
+        # Log the first drop and then periodically, so a stuck viewer doesn't flood the logs.
+        if self.dropped % 100 == 1:
+            logger.warning(f"Viewer falling behind: {self.dropped} frame(s) dropped, queue depth {self.depth}")
+
+    async def _write_loop(self):
+        try:
+            while True:
+                await self._ready.wait()
+                while self.frames:
+                    await self.websocket.send_bytes(self.frames.popleft()[1])
+                self._idle.set()
+                self._ready.clear()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Stale WS, cleanup handled by handle_user_connection
+            pass
+        finally:
+            self.closed = True
+            self._idle.set()
@@ -0,0 +1,97 @@
+import asyncio
+import logging
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import WebSocket
+
+logger = logging.getLogger(__name__)
+
+PRESENCE_HEARTBEAT_SECONDS = 15
+# An instance's entries outlive its last heartbeat by this long, e.g. after a crash.
+PRESENCE_TTL_SECONDS = 45
+
+
+def presence_key(robot_id: str, user_id: str) -> str:
+    return f"presence:{robot_id}:{user_id}"
+
+
+class PresenceRegistry:
+    """
+    Which users have a /control connection to which robots, answerable in O(1) on any
+    instance (the MediaMTX read webhook may land on an instance the viewer isn't on).
+
+    Locally, (robot_id, user_id) -> [open connection count, email]. Each pair with at least
+    one connection here is mirrored to a Redis hash 'presence:{robot_id}:{user_id}' with one
+    field per instance, valued "<expires_at>:<email>". A heartbeat pushes expires_at forward
+    and the key's TTL along with it; the field is removed when the last local connection
+    closes, and entries left by a dead instance expire on their own.
+    """
+    def __init__(self):
+        self.redis = None  # set by TelemetryManager.connect(); without it only local presence is seen
+        self.instance_id = uuid.uuid4().hex
+        self.local: Dict[Tuple[str, str], List] = {}
+        self.sockets: Dict[WebSocket, Tuple[str, str]] = {}
+
+    async def join(self, websocket: WebSocket, robot_id: str, user_id: str, email: str):
+        key = (robot_id, user_id)
+        self.sockets[websocket] = key
+        entry = self.local.get(key)
+        if entry is not None:
+            entry[0] += 1
+            return
+        self.local[key] = [1, email.lower()]
+        await self._publish([key])
+
+    async def leave(self, websocket: WebSocket):
+        key = self.sockets.pop(websocket, None)
+        if key is None:
+            return
+        entry = self.local[key]
+        entry[0] -= 1
+        if entry[0] > 0:
+            return
+        del self.local[key]
+        if self.redis is None:
+            return
+        try:
+            await self.redis.hdel(presence_key(*key), self.instance_id)
+        except Exception as e:
+            logger.warning(f"Could not clear presence for {key}: {e}")
+
+    async def connected_email(self, robot_id: str, user_id: str) -> Optional[str]:
+        """The user's email if they have a /control connection to robot_id on any instance, else None."""
+        entry = self.local.get((robot_id, user_id))
+        if entry is not None:
+            return entry[1]
+        if self.redis is None:
+            return None
+        now = time.time()
+        for value in (await self.redis.hgetall(presence_key(robot_id, user_id))).values():
+            expires_at, _, email = value.partition(":")
+            if float(expires_at) > now:
+                return email
+        return None
+
+    async def _publish(self, keys: List[Tuple[str, str]]):
+        if self.redis is None or not keys:
+            return
+        expires_at = time.time() + PRESENCE_TTL_SECONDS
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            for key in keys:
+                entry = self.local.get(key)
+                if entry is None:
+                    continue
+                pipe.hset(presence_key(*key), self.instance_id, f"{expires_at}:{entry[1]}")
+                pipe.expire(presence_key(*key), PRESENCE_TTL_SECONDS)
+            await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Could not publish presence for {len(keys)} user(s): {e}")
+
+    async def run(self):
+        """Background task: refresh this instance's presence entries before they expire."""
+        while True:
+            await asyncio.sleep(PRESENCE_HEARTBEAT_SECONDS)
+            await self._publish(list(self.local))
@@ -50,9 +50,6 @@ import logging
 from pathlib import Path
 from functools import lru_cache
 
-import frontmatter
-import markdown
-
 logger = logging.getLogger(__name__)
 
 # A real test-mode Price ID from the shared sample Stripe account. Used whenever
@@ -113,6 +110,10 @@ def load_product(slug: str, asset_bucket_url: str, test_mode: bool = False) -> d
     if not desc_path.exists():
         return None
 
+    # Imported here rather than at module level: only product pages need them.
+    import frontmatter
+    import markdown
+
     post = frontmatter.load(str(desc_path))
     meta = post.metadata
 
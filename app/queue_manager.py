@@ -24,6 +24,10 @@ class QueueManager:
             raise e
         logger.info("QueueManager connected to Redis")
 
+    async def close(self):
+        if self.redis is not None:
+            await self.redis.aclose()
+
     async def join_queue(self, robot_id: str, user_id: str):
         """Adds a user to the waiting line."""
         key = f"queue:{robot_id}"
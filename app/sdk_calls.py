@@ -0,0 +1,95 @@
+import asyncio
+import logging
+import os
+import time
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+from fastapi import HTTPException
+
+logger = logging.getLogger(__name__)
+
+FIREBASE_MAX_CONCURRENCY = int(os.getenv("FIREBASE_MAX_CONCURRENCY", "8"))
+FIREBASE_TIMEOUT_SECONDS = float(os.getenv("FIREBASE_TIMEOUT_SECONDS", "10"))
+STRIPE_MAX_CONCURRENCY = int(os.getenv("STRIPE_MAX_CONCURRENCY", "8"))
+STRIPE_TIMEOUT_SECONDS = float(os.getenv("STRIPE_TIMEOUT_SECONDS", "20"))
+
+# Upper bounds of the latency histogram buckets, in milliseconds; the last bucket is open.
+LATENCY_BUCKETS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+
+class LatencyHistogram:
+    def __init__(self, buckets_ms: List[float] = LATENCY_BUCKETS_MS):
+        self.buckets_ms = buckets_ms
+        self.counts = [0] * (len(buckets_ms) + 1)
+        self.total_ms = 0.0
+
+    def observe(self, seconds: float):
+        ms = seconds * 1000
+        self.counts[bisect_left(self.buckets_ms, ms)] += 1
+        self.total_ms += ms
+
+    def snapshot(self) -> Dict[str, int]:
+        labels = [f"le_{b}ms" for b in self.buckets_ms] + ["inf"]
+        return dict(zip(labels, self.counts))
+
+
+class ServiceExecutor:
+    """
+    Runs one external service's blocking SDK calls (Firebase Admin, Stripe) in a thread
+    pool of its own, so a slow call stalls neither the event loop nor the other service.
+
+    At most max_concurrency calls run at once; further callers wait their turn on the
+    event loop. A caller stops waiting after timeout seconds and gets a 504, though the
+    SDK call itself can't be interrupted and keeps its worker until it returns.
+    Latency (including time spent waiting for a worker) goes into a histogram.
+    """
+    def __init__(self, name: str, max_concurrency: int, timeout: float):
+        self.name = name
+        self.timeout = timeout
+        self.pool = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix=f"{name}-sdk")
+        self.slots = asyncio.Semaphore(max_concurrency)
+        self.latency = LatencyHistogram()
+        self.in_flight = 0
+        self.timeouts = 0
+        self.errors = 0
+
+    async def run(self, fn: Callable, *args, **kwargs):
+        """Call fn(*args, **kwargs) on this service's pool and return its result."""
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        try:
+            async with asyncio.timeout(self.timeout):
+                await self.slots.acquire()
+                # The slot is held until the call returns, not until we stop waiting, so
+                # calls that outlive their timeout still count against the limit.
+                future = loop.run_in_executor(self.pool, lambda: fn(*args, **kwargs))
+                self.in_flight += 1
+                future.add_done_callback(self._finished)
+                return await asyncio.shield(future)
+        except TimeoutError:
+            self.timeouts += 1
+            logger.warning(f"{self.name} call {getattr(fn, '__qualname__', fn)} timed out after {self.timeout}s")
+            raise HTTPException(status_code=504, detail=f"{self.name} did not respond in time")
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self.latency.observe(time.perf_counter() - start)
+
+    def _finished(self, _future):
+        self.in_flight -= 1
+        self.slots.release()
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "timeouts": self.timeouts,
+            "errors": self.errors,
+            "latency": self.latency.snapshot(),
+        }
+
+
+firebase_calls = ServiceExecutor("firebase", FIREBASE_MAX_CONCURRENCY, FIREBASE_TIMEOUT_SECONDS)
+stripe_calls = ServiceExecutor("stripe", STRIPE_MAX_CONCURRENCY, STRIPE_TIMEOUT_SECONDS)
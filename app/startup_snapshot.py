@@ -0,0 +1,81 @@
+import asyncio
+import logging
+import time
+from typing import Dict, Optional, Set
+
+from .telemetry_wire import iter_items, item_retain_key, item_uplink_online, encode_batch, encode_uplink_item
+
+logger = logging.getLogger(__name__)
+
+
+class StartupSnapshot:
+    """
+    In-process copy of what a new UI for one robot must be sent on connect: the robot's
+    uplink status and its retained items.
+
+    Seeded from Redis once, then kept current from the 'state:{robot_id}' frames this
+    instance already receives for the robot's viewers, so a burst of connects costs no
+    Redis calls. The serialized startup batch is built on demand and reused until a frame
+    changes the retained set or the uplink status.
+    """
+    def __init__(self, robot_id: str):
+        self.robot_id = robot_id
+        self.online = False
+        self.retained: Dict[str, bytes] = {}  # retain_key -> serialized TelemetryItem
+        self.last_frame_at = time.monotonic()
+        self.ready = asyncio.Event()
+        self.seed_error: Optional[Exception] = None
+        self._encoded: Optional[bytes] = None
+        # What the stream has already told us during seeding; it is newer than the seed.
+        self._stream_keys: Set[str] = set()
+        self._stream_online = False
+
+    def seed(self, online: bool, retained: Dict[bytes, bytes]):
+        """Fill in state read from Redis, without overwriting anything newer from the stream."""
+        if not self._stream_online:
+            self.online = online
+        for key, item_bytes in retained.items():
+            key = key.decode("utf-8")
+            if key not in self._stream_keys:
+                self.retained[key] = item_bytes
+        self._encoded = None
+        self.ready.set()
+
+    def fail(self, error: Exception):
+        """Seeding failed; release anyone waiting on it with the same error."""
+        self.seed_error = error
+        self.ready.set()
+
+    def apply_frame(self, payload: bytes):
+        """Fold one 'state:' frame into the snapshot."""
+        self.last_frame_at = time.monotonic()
+        for item in iter_items(payload):
+            online = item_uplink_online(item)
+            if online is not None:
+                self.online = online
+                self._stream_online = True
+                self._encoded = None
+            retain_key = item_retain_key(item)
+            if retain_key is not None:
+                self.retained[retain_key] = bytes(item)
+                self._stream_keys.add(retain_key)
+                self._encoded = None
+
+    def is_stale(self, max_silence: float) -> bool:
+        """
+        True if the robot is believed online but nothing has arrived for max_silence seconds.
+        A robot whose control-plane instance died never publishes its offline update; Redis
+        expires its uplink_state instead, and only a reseed will notice.
+        """
+        return self.online and time.monotonic() - self.last_frame_at > max_silence
+
+    def encode(self) -> bytes:
+        """Serialized TelemetryBatchUpdate for a new UI: uplink status, then retained items if online."""
+        if self._encoded is None:
+            # Stored items are concatenated as-is, so even a large TargetList or AnchorPoses
+            # is never decoded or re-encoded here.
+            startup_items = [encode_uplink_item(self.online)]
+            if self.online:
+                startup_items.extend(self.retained.values())
+            self._encoded = encode_batch(self.robot_id, startup_items)
+        return self._encoded
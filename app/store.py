@@ -12,12 +12,13 @@ import logging
 import os
 import time
 
-import stripe
 from fastapi import APIRouter, HTTPException, Request
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel, Field
 
 from .product_loader import load_product, load_all_products
+from .lazy_imports import stripe
+from .sdk_calls import stripe_calls
 
 logger = logging.getLogger(__name__)
 
@@ -28,7 +29,15 @@ ASSET_BUCKET_URL = os.environ.get("VITE_ASSET_BUCKET_URL", "")
 # Stripe Checkout Credentials (Loaded from environment / GCP Secret Manager)
 STRIPE_SECRET_KEY = os.environ.get("STRIPE_SECRET_KEY", "")
 STRIPE_PUBLISHABLE_KEY = os.environ.get("STRIPE_PUBLISHABLE_KEY", "")
-stripe_client = stripe.StripeClient(STRIPE_SECRET_KEY)
+_stripe_client = None
+
+
+def _get_stripe_client() -> "stripe.StripeClient":
+    """The Stripe client, built on first use (see lazy_imports)."""
+    global _stripe_client
+    if _stripe_client is None:
+        _stripe_client = stripe.StripeClient(STRIPE_SECRET_KEY)
+    return _stripe_client
 
 # Test-mode and live-mode keys reference entirely different Stripe objects, so
 # the secret key's prefix tells us which set of Price/Shipping Rate IDs are
@@ -206,7 +215,7 @@ async def _get_price_info(price_id: str) -> dict | None:
     cached = _PRICE_DISPLAY_CACHE.get(price_id)
     if cached is None or time.monotonic() - cached[1] > PRICE_DISPLAY_CACHE_TTL:
         try:
-            price = await stripe_client.v1.prices.retrieve_async(price_id)
+            price = await _get_stripe_client().v1.prices.retrieve_async(price_id)
             unit_amount, currency = price.unit_amount, price.currency
         except stripe.StripeError as e:
             logger.warning(f"Could not fetch Stripe price {price_id}: {e}")
@@ -405,7 +414,7 @@ async def create_checkout_session(request: Request, payload: CreateCheckoutSessi
         session_params["custom_fields"] = [CUSTOMS_ID_CUSTOM_FIELD]
 
     try:
-        session = stripe_client.v1.checkout.sessions.create(params=session_params)
+        session = await stripe_calls.run(_get_stripe_client().v1.checkout.sessions.create, params=session_params)
     except stripe.StripeError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -433,7 +442,7 @@ def _customs_id_from_session(session) -> str | None:
 @router.get("/session-status")
 async def session_status(session_id: str):
     try:
-        session = stripe_client.v1.checkout.sessions.retrieve(session_id)
+        session = await stripe_calls.run(_get_stripe_client().v1.checkout.sessions.retrieve, session_id)
     except stripe.StripeError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -449,7 +458,7 @@ async def session_status(session_id: str):
         and session_id not in _receipt_email_sent
     ):
         try:
-            await stripe_client.v1.payment_intents.update_async(
+            await _get_stripe_client().v1.payment_intents.update_async(
                 session.payment_intent,
                 params={"receipt_email": customer_email},
             )
@@ -0,0 +1,99 @@
+import asyncio
+import logging
+import os
+import traceback
+from typing import Callable, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# "pubsub" (default) publishes robot frames on 'state:{robot_id}'. "streams" appends them to a
+# capped Redis Stream per robot instead, which instances read with XREAD and UIs can replay from.
+TELEMETRY_TRANSPORT = os.getenv("TELEMETRY_TRANSPORT", "pubsub")
+# Approximate number of frames kept per robot stream; ~30 s of history at 30 Hz.
+TELEMETRY_STREAM_MAXLEN = int(os.getenv("TELEMETRY_STREAM_MAXLEN", "1000"))
+# A robot's stream is deleted this long after its last frame, so retired robots don't linger.
+STREAM_TTL_SECONDS = 3600
+# How long one XREAD waits for new frames before picking up changes to the set of robots read.
+STREAM_BLOCK_MS = 1000
+FRAME_FIELD = b"frame"
+
+
+def stream_key(robot_id: str) -> str:
+    return f"telemetry:{robot_id}"
+
+
+def parse_entry_id(entry_id) -> Tuple[int, int]:
+    """Order-comparable form of a stream ID ('ms-seq', or just 'ms' as clients may send)."""
+    if isinstance(entry_id, bytes):
+        entry_id = entry_id.decode("ascii")
+    ms, _, seq = entry_id.partition("-")
+    return int(ms), int(seq or 0)
+
+
+class StreamReader:
+    """
+    Reads the telemetry streams of the robots this instance serves.
+
+    The streams counterpart of SubscriptionManager: robots are acquired/released as their
+    viewers come and go, and a single task blocks in XREAD on all acquired streams at once.
+    Each stream's read position survives Redis hiccups, so frames are picked up where the
+    last read left off instead of being lost like pub/sub messages.
+    """
+    def __init__(self):
+        self.redis = None
+        self.refcounts: Dict[str, int] = {}   # robot_id -> number of holders on this instance
+        self.offsets: Dict[str, bytes] = {}   # stream key -> last entry ID delivered
+        self._changed = asyncio.Event()
+
+    async def acquire(self, robot_id: str):
+        count = self.refcounts.get(robot_id, 0) + 1
+        self.refcounts[robot_id] = count
+        if count == 1:
+            # Start from the newest entry that exists now. The startup snapshot covers
+            # everything before it, and XREAD will deliver everything after it.
+            key = stream_key(robot_id)
+            latest = await self.redis.xrevrange(key, count=1)
+            if robot_id in self.refcounts and key not in self.offsets:
+                self.offsets[key] = latest[0][0] if latest else b"0-0"
+                self._changed.set()
+
+    def release(self, robot_id: str):
+        count = self.refcounts.get(robot_id, 0) - 1
+        if count > 0:
+            self.refcounts[robot_id] = count
+            return
+        self.refcounts.pop(robot_id, None)
+        self.offsets.pop(stream_key(robot_id), None)
+
+    async def replay(self, robot_id: str, after_id: str, limit: int = TELEMETRY_STREAM_MAXLEN) -> List[Tuple[bytes, bytes]]:
+        """Frames recorded after after_id (exclusive), oldest first, as (entry_id, frame) pairs."""
+        entries = await self.redis.xrange(stream_key(robot_id), min=f"({after_id}", max="+", count=limit)
+        return [(entry_id, fields[FRAME_FIELD]) for entry_id, fields in entries if FRAME_FIELD in fields]
+
+    async def run(self, deliver: Callable[[str, bytes, bytes], None]):
+        """Background task: XREAD all acquired streams and hand each frame to deliver(robot_id, frame, entry_id)."""
+        retry_delay = 1
+        while True:
+            try:
+                if not self.offsets:
+                    await self._changed.wait()
+                self._changed.clear()
+                response = await self.redis.xread(dict(self.offsets), block=STREAM_BLOCK_MS, count=100)
+                retry_delay = 1
+                for key, entries in response or []:
+                    if isinstance(key, bytes):
+                        key = key.decode("utf-8")
+                    if key not in self.offsets:
+                        continue  # released while we were blocked
+                    robot_id = key.split(":", 1)[1]
+                    for entry_id, fields in entries:
+                        self.offsets[key] = entry_id
+                        frame = fields.get(FRAME_FIELD)
+                        if frame is not None:
+                            deliver(robot_id, frame, entry_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.error(f"Telemetry stream reader crashed. Retrying in {retry_delay}s...\n{traceback.format_exc()}")
+                await asyncio.sleep(retry_delay)
+                retry_delay = min(retry_delay * 2, 60)
@@ -0,0 +1,76 @@
+import asyncio
+import logging
+from typing import Dict, Set
+
+logger = logging.getLogger(__name__)
+
+
+class SubscriptionManager:
+    """
+    Refcounted Redis channel subscriptions on a single pub/sub connection.
+
+    Each instance only wants the channels of robots it actually serves:
+    'state:{robot_id}' while at least one UI for that robot is connected here, and
+    'commands:{robot_id}' while this instance holds the robot's socket. Callers
+    acquire/release channels as sockets come and go; the first acquire subscribes
+    and the last release unsubscribes.
+
+    The pub/sub object is attached by the listener task once it is connected, and
+    re-attached after every reconnect, at which point every channel with a live
+    refcount is subscribed again. Acquire/release while detached only adjust counts.
+    """
+    def __init__(self):
+        self.refcounts: Dict[str, int] = {}   # channel -> number of holders on this instance
+        self.subscribed: Set[str] = set()     # channels currently subscribed on the pub/sub connection
+        self.pubsub = None
+        # Serializes SUBSCRIBE/UNSUBSCRIBE so a quick acquire/release pair can't reorder on the wire.
+        self._lock = asyncio.Lock()
+
+    async def attach(self, pubsub):
+        """Bind a freshly connected pub/sub object and subscribe everything currently held."""
+        async with self._lock:
+            self.pubsub = pubsub
+            self.subscribed = set()
+            channels = list(self.refcounts)
+            if channels:
+                await pubsub.subscribe(*channels)
+                self.subscribed.update(channels)
+        logger.info(f"Subscribed to {len(channels)} robot channel(s).")
+
+    def detach(self):
+        """Forget the pub/sub object (it died with its connection)."""
+        self.pubsub = None
+        self.subscribed = set()
+
+    async def acquire(self, channel: str):
+        self.refcounts[channel] = self.refcounts.get(channel, 0) + 1
+        await self._sync(channel)
+
+    async def release(self, channel: str):
+        count = self.refcounts.get(channel, 0) - 1
+        if count > 0:
+            self.refcounts[channel] = count
+        else:
+            self.refcounts.pop(channel, None)
+        await self._sync(channel)
+
+    def holds(self, channel: str) -> bool:
+        return channel in self.refcounts
+
+    async def _sync(self, channel: str):
+        """Bring the pub/sub connection in line with the refcount for one channel."""
+        async with self._lock:
+            if self.pubsub is None:
+                return
+            wanted = channel in self.refcounts
+            try:
+                if wanted and channel not in self.subscribed:
+                    await self.pubsub.subscribe(channel)
+                    self.subscribed.add(channel)
+                elif not wanted and channel in self.subscribed:
+                    await self.pubsub.unsubscribe(channel)
+                    self.subscribed.discard(channel)
+            except Exception as e:
+                # The listener will notice the dead connection and re-attach, which
+                # resubscribes from the refcounts, so there is nothing to undo here.
+                logger.warning(f"Could not update subscription for {channel}: {e}")
@@ -0,0 +1,182 @@
+"""Columnar extraction of pos_estimate telemetry, for accuracy analysis over long recordings.
+
+decode_pos_estimates() walks serialized TelemetryBatchUpdate frames (from a
+TelemetryRecording, a telemetry stream, ...) once and returns every PositionEstimate as
+one row of a NumPy structured array, one column per scalar. Frames are read with the
+wire-format walker in telemetry_wire, so no betterproto2 objects are built per sample.
+
+Field numbers mirror telemetry.proto / common.proto in nf_robot:
+    TelemetryItem { PositionEstimate pos_estimate = 1; ... }
+    PositionEstimate { Vec3 gantry_position = 1; Vec3 gantry_velocity = 2; Pose gripper_pose = 3;
+                       double data_ts = 4; repeated bool slack = 5; }
+    Pose { Vec3 rotation = 1; Vec3 position = 2; }
+    Vec3 { float x = 1; float y = 2; float z = 3; }
+"""
+import struct
+from typing import Iterable, Sequence
+
+import numpy as np
+
+from .telemetry_wire import (
+    iter_items,
+    iter_fields,
+    read_varint,
+    WIRETYPE_VARINT,
+    WIRETYPE_FIXED64,
+    WIRETYPE_FIXED32,
+    WIRETYPE_LENGTH_DELIMITED,
+)
+
+ITEM_POS_ESTIMATE = 1
+POS_GANTRY_POSITION = 1
+POS_GANTRY_VELOCITY = 2
+POS_GRIPPER_POSE = 3
+POS_DATA_TS = 4
+POS_SLACK = 5
+POSE_ROTATION = 1
+POSE_POSITION = 2
+
+# One slack flag per anchor; Stringman has four.
+MAX_ANCHORS = 4
+
+_VEC3_COLUMNS = {
+    "gantry_position": 1,
+    "gantry_velocity": 4,
+    "gripper_rotation": 7,
+    "gripper_position": 10,
+}
+_SLACK_COLUMN = 13
+
+# Missing sub-messages decode as NaN, so "not reported" is distinguishable from the origin.
+POS_ESTIMATE_DTYPE = np.dtype(
+    [("data_ts", np.float64)]
+    + [(f"{name}_{axis}", np.float32) for name in _VEC3_COLUMNS for axis in "xyz"]
+    + [(f"slack_{i}", np.bool_) for i in range(MAX_ANCHORS)]
+)
+
+_FLOAT = struct.Struct("<f")
+_DOUBLE = struct.Struct("<d")
+# tag 1 fixed32, x, tag 2 fixed32, y, tag 3 fixed32, z
+_VEC3_FULL = struct.Struct("<xfxfxf")
+_INITIAL_ROWS = 4096
+
+
+def _read_vec3(buf, row: list, column: int):
+    # Nearly every Vec3 on the wire is x, y, z in order with none at its default.
+    if len(buf) == _VEC3_FULL.size and buf[0] == 0x0D and buf[5] == 0x15 and buf[10] == 0x1D:
+        row[column:column + 3] = _VEC3_FULL.unpack(buf)
+        return
+    row[column] = row[column + 1] = row[column + 2] = 0.0
+    for field_number, wire_type, start, _ in iter_fields(buf):
+        if 1 <= field_number <= 3 and wire_type == WIRETYPE_FIXED32:
+            row[column + field_number - 1] = _FLOAT.unpack_from(buf, start)[0]
+
+
+def _read_slack(buf, wire_type: int, start: int, end: int, slack: list):
+    if wire_type == WIRETYPE_LENGTH_DELIMITED:  # packed, as proto3 writes it
+        pos = start
+        while pos < end:
+            value, pos = read_varint(buf, pos)
+            slack.append(value != 0)
+    elif wire_type == WIRETYPE_VARINT:
+        slack.append(read_varint(buf, start)[0] != 0)
+
+
+def _read_pos_estimate(buf) -> tuple:
+    nan = float("nan")
+    row = [0.0] + [nan] * (3 * len(_VEC3_COLUMNS)) + [False] * MAX_ANCHORS
+    slack = []
+    for field_number, wire_type, start, end in iter_fields(buf):
+        if field_number == POS_DATA_TS and wire_type == WIRETYPE_FIXED64:
+            row[0] = _DOUBLE.unpack_from(buf, start)[0]
+        elif wire_type == WIRETYPE_LENGTH_DELIMITED and field_number == POS_GANTRY_POSITION:
+            _read_vec3(buf[start:end], row, _VEC3_COLUMNS["gantry_position"])
+        elif wire_type == WIRETYPE_LENGTH_DELIMITED and field_number == POS_GANTRY_VELOCITY:
+            _read_vec3(buf[start:end], row, _VEC3_COLUMNS["gantry_velocity"])
+        elif wire_type == WIRETYPE_LENGTH_DELIMITED and field_number == POS_GRIPPER_POSE:
+            pose = buf[start:end]
+            for pose_field, pose_type, pose_start, pose_end in iter_fields(pose):
+                if pose_type != WIRETYPE_LENGTH_DELIMITED:
+                    continue
+                if pose_field == POSE_ROTATION:
+                    _read_vec3(pose[pose_start:pose_end], row, _VEC3_COLUMNS["gripper_rotation"])
+                elif pose_field == POSE_POSITION:
+                    _read_vec3(pose[pose_start:pose_end], row, _VEC3_COLUMNS["gripper_position"])
+        elif field_number == POS_SLACK:
+            _read_slack(buf, wire_type, start, end, slack)
+    for i, flag in enumerate(slack[:MAX_ANCHORS]):
+        row[_SLACK_COLUMN + i] = flag
+    return tuple(row)
+
+
+def decode_pos_estimates(frames: Iterable[bytes]) -> np.ndarray:
+    """
+    Every pos_estimate item in frames (serialized TelemetryBatchUpdates), in order, as a
+    structured array of POS_ESTIMATE_DTYPE. The output is preallocated and doubled as
+    needed, so a long recording is decoded in one pass without a row-per-object list.
+    """
+    out = np.empty(_INITIAL_ROWS, dtype=POS_ESTIMATE_DTYPE)
+    n = 0
+    for frame in frames:
+        for item in iter_items(frame):
+            for field_number, wire_type, start, end in iter_fields(item):
+                if field_number != ITEM_POS_ESTIMATE or wire_type != WIRETYPE_LENGTH_DELIMITED:
+                    continue
+                if n == len(out):
+                    out = np.resize(out, 2 * len(out))
+                out[n] = _read_pos_estimate(item[start:end])
+                n += 1
+    return out[:n].copy()
+
+
+def vec3_column(samples: np.ndarray, name: str) -> np.ndarray:
+    """An (N, 3) float64 array of one Vec3 field, e.g. vec3_column(samples, "gantry_position")."""
+    return np.stack([samples[f"{name}_{axis}"] for axis in "xyz"], axis=1).astype(np.float64)
+
+
+def rms_deviation_from_line(points: np.ndarray, start: Sequence[float], end: Sequence[float]) -> float:
+    """
+    RMS perpendicular distance of (N, 3) points from the infinite line through start and
+    end, in the units of the points. This is what move_linearity measures for a straight move.
+    """
+    points = np.asarray(points, dtype=np.float64)
+    start = np.asarray(start, dtype=np.float64)
+    direction = np.asarray(end, dtype=np.float64) - start
+    length = np.linalg.norm(direction)
+    if length == 0:
+        raise ValueError("start and end of the line are the same point")
+    offsets = points - start
+    along = offsets @ (direction / length)
+    squared = np.einsum("ij,ij->i", offsets, offsets) - along * along
+    return float(np.sqrt(np.mean(np.maximum(squared, 0.0))))
+
+
+def rms_deviation_from_path(points: np.ndarray, path: np.ndarray, chunk: int = 65536) -> float:
+    """
+    RMS distance of (N, 3) points from a target path given as (M, 3) waypoints, where each
+    point is measured against the nearest segment of the polyline. Points are processed in
+    chunks so memory stays at chunk * (M - 1) regardless of N.
+    """
+    points = np.asarray(points, dtype=np.float64)
+    path = np.asarray(path, dtype=np.float64)
+    if len(path) < 2:
+        raise ValueError("path needs at least two waypoints")
+    seg_start = path[:-1]
+    seg_vec = path[1:] - seg_start
+    seg_len2 = np.einsum("ij,ij->i", seg_vec, seg_vec)
+    seg_len2[seg_len2 == 0] = np.inf  # a repeated waypoint degenerates to its start point
+
+    total = 0.0
+    for i in range(0, len(points), chunk):
+        block = points[i:i + chunk, None, :] - seg_start[None, :, :]
+        t = np.clip(np.einsum("nmk,mk->nm", block, seg_vec) / seg_len2, 0.0, 1.0)
+        nearest = block - t[..., None] * seg_vec[None, :, :]
+        total += np.einsum("nmk,nmk->nm", nearest, nearest).min(axis=1).sum()
+    return float(np.sqrt(total / len(points))) if len(points) else float("nan")
+
+
+def rms_deviation_from_target(points: np.ndarray, target: Sequence[float]) -> float:
+    """RMS distance of (N, 3) points from a single target position, e.g. a goalseek tag."""
+    points = np.asarray(points, dtype=np.float64)
+    deltas = points - np.asarray(target, dtype=np.float64)
+    return float(np.sqrt(np.mean(np.einsum("ij,ij->i", deltas, deltas))))
@@ -1,8 +1,10 @@
 import asyncio
 import json
 import logging
+import time
 import traceback
-from typing import Dict, List
+from dataclasses import dataclass
+from typing import Dict, List, Optional
 from fastapi import WebSocket, HTTPException
 import redis.asyncio as redis
 import os
@@ -10,24 +12,106 @@ from nf_robot.generated.nf import telemetry, control, common
 
 from .queue_manager import queue_manager
 from .database import record_robot_seen
+from .subscription_manager import SubscriptionManager
+from .outbound_queue import OutboundQueue, TELEMETRY_QUEUE_MAX
+from .coalescer import TelemetryCoalescer, TELEMETRY_COALESCE_MS
+from .telemetry_wire import scan_retained, encode_batch, encode_uplink_item
+from .startup_snapshot import StartupSnapshot
+from .telemetry_recorder import open_recorder
+from .access_cache import access_cache
+from .tickets import load_revocations, note_revocation
+from .presence import PresenceRegistry
+from .stream_transport import (
+    StreamReader,
+    TELEMETRY_TRANSPORT,
+    TELEMETRY_STREAM_MAXLEN,
+    STREAM_TTL_SECONDS,
+    FRAME_FIELD,
+    stream_key,
+    parse_entry_id,
+)
 
 logger = logging.getLogger(__name__)
 
+# robot:{id}:uplink_state expires this long after the last frame, marking a vanished robot offline.
+UPLINK_STATE_TTL_SECONDS = 60
+# How often the ingest loop pushes that expiry forward. Anything well under the TTL will do.
+UPLINK_TTL_REFRESH_SECONDS = 5
+# Sorted set of online robots scored by the unix time of their last heartbeat, so "is it
+# online" is one ZSCORE and "which are online" one ZRANGEBYSCORE, instead of a read per robot.
+ONLINE_ROBOTS_KEY = "robots:heartbeats"
+# How often the reaper looks for robots whose heartbeats stopped without a clean disconnect.
+REAPER_INTERVAL_SECONDS = 10
+# Atomically take robots whose last heartbeat is older than ARGV[1] out of the index, so that
+# with several instances reaping, each stale robot is announced offline exactly once.
+_REAP_SCRIPT = """
+local stale = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+if #stale > 0 then
+    redis.call('ZREM', KEYS[1], unpack(stale))
+end
+return stale
+"""
+
+
+def online_cutoff() -> float:
+    """Heartbeats older than this (unix time) no longer count as online."""
+    return time.time() - UPLINK_STATE_TTL_SECONDS
+
+
+@dataclass
+class IngestCounters:
+    """Redis cost of the robot ingest path on this instance."""
+    frames: int = 0
+    redis_commands: int = 0         # commands sent by the pipelined loop
+    round_trips: int = 0            # pipeline executions
+    unpipelined_commands: int = 0   # what the old publish/expire/hset-per-item loop would have sent, one round trip each
+
+    def per_frame(self) -> dict:
+        frames = self.frames or 1
+        return {
+            "frames": self.frames,
+            "commands_per_frame": self.redis_commands / frames,
+            "round_trips_per_frame": self.round_trips / frames,
+            "unpipelined_commands_per_frame": self.unpipelined_commands / frames,
+        }
+
+
 class TelemetryManager:
     """
     Handles WebSocket connections from robots and Redis Pub/Sub routing.
     - Routes user commands -> Redis 'commands:robot_id' -> Robot
     - Routes robot state -> Redis 'state:robot_id' -> Users
+      (or, with TELEMETRY_TRANSPORT=streams, Redis stream 'telemetry:robot_id' -> Users, with replay)
     """
     def __init__(self):
         self.active_user_connections: Dict[str, List[WebSocket]] = {} # robot_id -> [ws, ws]
         self.active_robot_connections: Dict[str, WebSocket] = {}      # robot_id -> ws
         self.user_email: Dict[WebSocket, str] = {}                    # ws -> email
+        # Who is connected to which robot, across all instances (see PresenceRegistry).
+        self.presence = PresenceRegistry()
+        self.outbound: Dict[WebSocket, OutboundQueue] = {}            # ws -> queue (or coalescer in front of it)
+        # Per-robot channel subscriptions, so this instance only receives traffic for robots it serves.
+        self.subscriptions = SubscriptionManager()
+        self.ingest_counters = IngestCounters()
+        # Startup state per robot with viewers here, kept current from its state channel.
+        self.startup_snapshots: Dict[str, StartupSnapshot] = {}
+        self.transport = TELEMETRY_TRANSPORT
+        if self.transport not in ("pubsub", "streams"):
+            raise ValueError(f"Unknown telemetry transport: {self.transport}")
+        self.streams = StreamReader()
+        # ws -> live frames held back while that UI's replay is being sent
+        self.replay_buffers: Dict[WebSocket, List[tuple]] = {}
         
         self.redis_url = os.getenv("REDIS_URL", "redis://localhost:6379")
         self.pub_redis = None
         self.sub_redis = None
+        self.decoding_redis = None
         self.listen_task = None
+        self.stream_task = None
+        self.reaper_task = None
+        self.presence_task = None
+        # Set once this instance starts shutting down; new websockets are turned away.
+        self.draining = False
 
     async def connect(self):
         # One connection for publishing binary telemetry
@@ -38,34 +122,157 @@ class TelemetryManager:
         self.sub_redis = redis.from_url(self.redis_url, decode_responses=False, protocol=2, socket_timeout=None)
         # Third connection for regular keys
         self.decoding_redis = redis.from_url(self.redis_url, decode_responses=True)
+        access_cache.redis = self.decoding_redis
+        self.presence.redis = self.decoding_redis
         
         # Ping to ensure connectivity at startup
-        await self.pub_redis.ping()
-        await self.sub_redis.ping()
+        await asyncio.gather(self.pub_redis.ping(), self.sub_redis.ping())
         
         self.listen_task = asyncio.create_task(self.listen_to_redis())
-        logger.info(f"TelemetryManager initialized. Listener task started.")
+        self.reaper_task = asyncio.create_task(self.reap_offline_robots())
+        self.presence_task = asyncio.create_task(self.presence.run())
+        if self.transport == "streams":
+            # Blocking XREADs want the connection without a socket timeout.
+            self.streams.redis = self.sub_redis
+            self.stream_task = asyncio.create_task(self.streams.run(self._deliver_state))
+        logger.info(f"TelemetryManager initialized ({self.transport} transport). Listener task started.")
+
+    async def drain(self, grace_seconds: float):
+        """
+        Hand this instance's websockets over to other instances before it exits.
+
+        Robots are closed first (1012, service restart) so they reconnect elsewhere right
+        away; their frames keep reaching viewers here through Redis meanwhile. Viewers then
+        get up to grace_seconds for their writers to send what is already queued before
+        they are closed too and reconnect (resuming with replay_from on the streams transport).
+        """
+        if self.draining:
+            return
+        self.draining = True
+        logger.info(f"Draining {len(self.active_robot_connections)} robot and {len(self.outbound)} UI connection(s)")
+        for ws in list(self.active_robot_connections.values()):
+            try:
+                await ws.close(code=1012)
+            except Exception:
+                pass
+        deadline = time.monotonic() + grace_seconds
+        while any(queue.depth for queue in self.outbound.values()) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        for ws in list(self.outbound):
+            try:
+                await ws.close(code=1012)
+            except Exception:
+                pass
+
+    async def close(self):
+        """Stop background tasks and close the Redis connections."""
+        for task in (self.listen_task, self.stream_task, self.reaper_task, self.presence_task):
+            if task is not None:
+                task.cancel()
+        await asyncio.gather(
+            *(task for task in (self.listen_task, self.stream_task, self.reaper_task, self.presence_task) if task),
+            return_exceptions=True,
+        )
+        self.listen_task = self.stream_task = self.reaper_task = self.presence_task = None
+        for conn in (self.pub_redis, self.sub_redis, self.decoding_redis):
+            if conn is not None:
+                await conn.aclose()
 
     async def disconnect(self, robot_id: str, client_type: str, websocket: WebSocket = None):
         if client_type == "robot":
-            self.active_robot_connections.pop(robot_id, None)
+            if self.active_robot_connections.pop(robot_id, None) is not None:
+                await self.subscriptions.release(f"commands:{robot_id}")
         else:
             connections = self.active_user_connections.get(robot_id, [])
             if websocket in connections:
                 connections.remove(websocket)
+                if not connections:
+                    del self.active_user_connections[robot_id]
+                    # Once unsubscribed, the snapshot would silently go stale.
+                    self.startup_snapshots.pop(robot_id, None)
+                await self._unwatch_state(robot_id)
             self.user_email.pop(websocket, None)
+            await self.presence.leave(websocket)
+            self.replay_buffers.pop(websocket, None)
+            queue = self.outbound.pop(websocket, None)
+            if queue is not None:
+                queue.stop()
+
+    def outbound_stats(self) -> Dict[str, List[dict]]:
+        """Outbound queue depth and frames dropped for every UI socket on this instance, by robot."""
+        return {
+            robot_id: [
+                {"depth": self.outbound[ws].depth, "dropped": self.outbound[ws].dropped}
+                for ws in connections if ws in self.outbound
+            ]
+            for robot_id, connections in self.active_user_connections.items()
+        }
+
+    async def _watch_state(self, robot_id: str):
+        """Start receiving this robot's telemetry on this instance (refcounted)."""
+        if self.transport == "streams":
+            await self.streams.acquire(robot_id)
+        else:
+            await self.subscriptions.acquire(f"state:{robot_id}")
+
+    async def _unwatch_state(self, robot_id: str):
+        if self.transport == "streams":
+            self.streams.release(robot_id)
+        else:
+            await self.subscriptions.release(f"state:{robot_id}")
+
+    def _publish_state(self, pipe, robot_id: str, data: bytes):
+        """Queue a serialized TelemetryBatchUpdate for every instance serving this robot's UIs."""
+        if self.transport == "streams":
+            pipe.xadd(stream_key(robot_id), {FRAME_FIELD: data}, maxlen=TELEMETRY_STREAM_MAXLEN, approximate=True)
+        else:
+            pipe.publish(f"state:{robot_id}", data)
 
     async def mark_robot_online(self, robot_id: str, online: bool):
         key = f"robot:{robot_id}:uplink_state"
         await self.decoding_redis.hset(key, 'online', 'true' if online else 'false')
         if online:
-            await self.decoding_redis.expire(key, 60)
+            await self.decoding_redis.expire(key, UPLINK_STATE_TTL_SECONDS)
+            await self.decoding_redis.zadd(ONLINE_ROBOTS_KEY, {robot_id: time.time()})
+        else:
+            await self.decoding_redis.zrem(ONLINE_ROBOTS_KEY, robot_id)
         # publish a serialized batch update for all connected clients announcing that this robot is offline
-        batch = telemetry.TelemetryBatchUpdate(
-            robot_id=robot_id,
-            updates=[telemetry.TelemetryItem(uplink_status=telemetry.UplinkStatus(online=online))],
-        )
-        await self.pub_redis.publish(f"state:{robot_id}", bytes(batch))
+        batch = encode_batch(robot_id, [encode_uplink_item(online)])
+        pipe = self.pub_redis.pipeline(transaction=False)
+        self._publish_state(pipe, robot_id, batch)
+        await pipe.execute()
+
+    async def is_robot_online(self, robot_id: str) -> bool:
+        score = await self.decoding_redis.zscore(ONLINE_ROBOTS_KEY, robot_id)
+        return score is not None and score >= online_cutoff()
+
+    async def online_flags(self, robot_ids: List[str]) -> List[bool]:
+        """Online status of each robot, in order, with one command."""
+        if not robot_ids:
+            return []
+        cutoff = online_cutoff()
+        scores = await self.decoding_redis.zmscore(ONLINE_ROBOTS_KEY, robot_ids)
+        return [score is not None and score >= cutoff for score in scores]
+
+    async def online_count(self) -> int:
+        return await self.decoding_redis.zcount(ONLINE_ROBOTS_KEY, online_cutoff(), "+inf")
+
+    async def reap_offline_robots(self):
+        """
+        Background task: robots whose heartbeats stopped (their control-plane instance died,
+        or the network dropped without a close) are taken out of the online index and
+        announced offline to their UIs, like a clean disconnect would.
+        """
+        reap = self.decoding_redis.register_script(_REAP_SCRIPT)
+        while True:
+            await asyncio.sleep(REAPER_INTERVAL_SECONDS)
+            try:
+                stale = await reap(keys=[ONLINE_ROBOTS_KEY], args=[online_cutoff(), 1000])
+                for robot_id in stale:
+                    logger.info(f"Robot {robot_id} stopped sending heartbeats; marking it offline")
+                    await self.mark_robot_online(robot_id, False)
+            except Exception as e:
+                logger.error(f"Offline robot reaper failed: {e}")
 
     async def handle_robot_connection(self, websocket: WebSocket, robot_id: str):
         """
@@ -73,14 +280,11 @@ class TelemetryManager:
         Every message on the websocket will be a serialized TelemetryBatchUpdate
         Every message sent must be a serialized ControlBatchUpdate
         """
-        online = False
-        up_status = await self.decoding_redis.hgetall(f"robot:{robot_id}:uplink_state")
-        if up_status and 'online' in up_status:
-            online = up_status['online'] == 'true'
-        if online:
+        if await self.is_robot_online(robot_id):
             raise HTTPException(status_code=409, detail="A robot with this ID is already connected and active.")
 
         self.active_robot_connections[robot_id] = websocket
+        await self.subscriptions.acquire(f"commands:{robot_id}")
         await self.mark_robot_online(robot_id, True)
 
         # Record fleet activity (best-effort — never drop the connection over it).
@@ -89,46 +293,97 @@ class TelemetryManager:
         except Exception as e:
             logger.error(f"Failed to record activity for robot {robot_id}: {e}")
 
+        uplink_key = f"robot:{robot_id}:uplink_state"
+        retained_key = f"robot:{robot_id}:retained"
+        counters = self.ingest_counters
+        last_ttl_refresh = time.monotonic()  # mark_robot_online just set it and the heartbeat
+        recorder = open_recorder(robot_id)
+
         try:
             while True:
                 data = await websocket.receive_bytes()
+                if recorder:
+                    recorder.append(data)
+                # All of this frame's writes go out in one round trip, without MULTI/EXEC.
+                pipe = self.pub_redis.pipeline(transaction=False)
                 # Robot sends its state, put on redis channel for this robot. (already serialized data)
                 # We publish this to Redis so all web servers can forward it to UI's connected to this robot.
-                await self.pub_redis.publish(f"state:{robot_id}", data)
-                await self.decoding_redis.expire(f"robot:{robot_id}:uplink_state", 60)
-                
-                # deserialize and look for retain_key in any TelemetryItems
-                batch = telemetry.TelemetryBatchUpdate().parse(data)
-                for item in batch.updates:
-                    if item.retain_key is not None:
-                        # retain this item at this key
-                        await self.pub_redis.hset(
-                            f"robot:{robot_id}:retained", 
-                            item.retain_key, 
-                            bytes(item) # serialized item
-                        )
+                self._publish_state(pipe, robot_id, data)
+
+                now = time.monotonic()
+                heartbeat_at = None
+                if now - last_ttl_refresh >= UPLINK_TTL_REFRESH_SECONDS:
+                    # The reaper may have marked a connected robot offline after a long
+                    # silence, so the heartbeat restates online rather than just extending it.
+                    pipe.hset(uplink_key, 'online', 'true')
+                    pipe.expire(uplink_key, UPLINK_STATE_TTL_SECONDS)
+                    heartbeat_at = len(pipe)
+                    pipe.zadd(ONLINE_ROBOTS_KEY, {robot_id: time.time()})
+                    await record_robot_seen(robot_id)
+                    if self.transport == "streams":
+                        pipe.expire(stream_key(robot_id), STREAM_TTL_SECONDS)
+                    last_ttl_refresh = now
+
+                # look for retain_key in any TelemetryItems without decoding the frame
+                # and retain each item at its key (serialized item, sliced straight out of the frame)
+                retained = scan_retained(data)
+                if retained:
+                    pipe.hset(retained_key, mapping=dict(retained))
+
+                counters.frames += 1
+                counters.redis_commands += len(pipe)
+                counters.round_trips += 1
+                counters.unpipelined_commands += 2 + len(retained)
+                results = await pipe.execute()
+                if heartbeat_at is not None and results[heartbeat_at]:
+                    # ZADD added it back, so the reaper had announced it offline; undo that for its UIs.
+                    logger.info(f"Robot {robot_id} resumed after being reaped; marking it online")
+                    await self.mark_robot_online(robot_id, True)
         except Exception as e:
             logger.error(f"Robot {robot_id} connection lost: {e}")
             raise e
         finally:
+            if recorder:
+                recorder.close()
             await self.disconnect(robot_id, "robot")
             await self.mark_robot_online(robot_id, False)
 
 
-    async def handle_user_connection(self, websocket: WebSocket, robot_id: str, user_id: str, user_email: str = ""):
+    async def handle_user_connection(
+        self,
+        websocket: WebSocket,
+        robot_id: str,
+        user_id: str,
+        user_email: str = "",
+        coalesce_ms: int = TELEMETRY_COALESCE_MS,
+        replay_from: Optional[str] = None,
+    ):
         """
         Logic for a Browser User connecting with a web UI to control a given robot.
         Authentication is handled at the API layer.
+        With coalesce_ms > 0, high-rate telemetry is merged per window before it is sent (see TelemetryCoalescer).
+        With the streams transport, replay_from (a stream ID, or a millisecond timestamp) first
+        resends every frame recorded after it, so a reconnecting UI can catch up.
         """
+        queue = OutboundQueue(websocket)
+        queue.start()
+        self.outbound[websocket] = TelemetryCoalescer(queue, robot_id, coalesce_ms) if coalesce_ms > 0 else queue
         if robot_id not in self.active_user_connections:
             self.active_user_connections[robot_id] = []
         self.active_user_connections[robot_id].append(websocket)
         self.user_email[websocket] = user_email.lower()
+        if replay_from and self.transport == "streams":
+            self.replay_buffers[websocket] = []
 
         try:
+            # Inside the try: if Redis fails here, disconnect() still undoes all of the above.
+            await self.presence.join(websocket, robot_id, user_id, user_email)
+            await self._watch_state(robot_id)
             startup_batch = await self.get_startup_state(robot_id)
             if startup_batch is not None:
-                await websocket.send_bytes(startup_batch)
+                queue.put(startup_batch)
+            if websocket in self.replay_buffers:
+                await self._replay(websocket, robot_id, replay_from)
 
             while True:
                 # data is a serialized ControlBatchUpdate. leave it serialized
@@ -139,56 +394,112 @@ class TelemetryManager:
             logger.error(f"User disconnected: {e}")
             await self.disconnect(robot_id, "user", websocket)
 
+    async def _replay(self, websocket: WebSocket, robot_id: str, replay_from: str):
+        """
+        Send a UI the frames recorded after replay_from, then release the live frames held
+        back meanwhile, skipping any the replay already covered.
+
+        A replay can be a whole stream (TELEMETRY_STREAM_MAXLEN frames), far more than the
+        viewer's queue holds, so it is fed in with backpressure: once half a queue is
+        waiting, wait for the writer to send it rather than let the drop policy evict it.
+        """
+        sink = self.outbound[websocket]
+        last_sent = (0, 0)
+        try:
+            last_sent = parse_entry_id(replay_from)
+            for entry_id, frame in await self.streams.replay(robot_id, replay_from):
+                if sink.depth >= TELEMETRY_QUEUE_MAX // 2 and not await sink.drained():
+                    break  # the socket is gone; disconnect() cleans up
+                sink.put(frame)
+                last_sent = parse_entry_id(entry_id)
+        except ValueError:
+            logger.warning(f"Ignoring malformed replay_from {replay_from!r} for {robot_id}")
+        finally:
+            for entry_id, frame in self.replay_buffers.pop(websocket, []):
+                if entry_id is None or parse_entry_id(entry_id) > last_sent:
+                    sink.put(frame)
+
     async def get_startup_state(self, robot_id: str) -> bytes:
         """
         Fetch all retained messages for a robot to send to a new UI.
         Returns bytes of a TelemetryBatchUpdate.
+
+        Served from the robot's StartupSnapshot, which only touches Redis the first time a
+        viewer of this robot connects to this instance (the caller must already hold the
+        robot's state channel, so the snapshot is kept current from then on).
         """
+        snapshot = self.startup_snapshots.get(robot_id)
+        if snapshot is not None and snapshot.ready.is_set() and snapshot.is_stale(UPLINK_STATE_TTL_SECONDS):
+            snapshot = None
+        if snapshot is None:
+            snapshot = StartupSnapshot(robot_id)
+            self.startup_snapshots[robot_id] = snapshot
+            try:
+                await self._seed_snapshot(snapshot)
+            except Exception as e:
+                if self.startup_snapshots.get(robot_id) is snapshot:
+                    del self.startup_snapshots[robot_id]
+                snapshot.fail(e)
+                raise
+        else:
+            # Another viewer may be seeding it right now.
+            await snapshot.ready.wait()
+            if snapshot.seed_error is not None:
+                raise snapshot.seed_error
+        return snapshot.encode()
 
+    async def _seed_snapshot(self, snapshot: StartupSnapshot):
+        pipe = self.pub_redis.pipeline(transaction=False)
+        pipe.hgetall(f"robot:{snapshot.robot_id}:uplink_state")
+        # HGETALL returns a dict {field_bytes: value_bytes}
+        pipe.hgetall(f"robot:{snapshot.robot_id}:retained")
+        up_status, retained_raw = await pipe.execute()
         # always send an UplinkStatus about whether the robot is connected to the control_plane
-        online = False
-        up_status = await self.decoding_redis.hgetall(f"robot:{robot_id}:uplink_state")
-        if up_status and 'online' in up_status:
-            online = up_status['online'] == 'true'
-        startup_items = [telemetry.TelemetryItem(uplink_status=telemetry.UplinkStatus(online=online))]
+        online = up_status.get(b'online') == b'true' if up_status else False
+        snapshot.seed(online, retained_raw or {})
 
-        # If it's online, send all the retained UI startup messages
-        if online:
-            # HGETALL returns a dict {field_bytes: value_bytes}
-            # This is a single atomic operation.
-            retained_raw = await self.pub_redis.hgetall(f"robot:{robot_id}:retained")
-            if retained_raw:
-                for raw_item_bytes in retained_raw.values():
-                    # We stored the 'TelemetryItem' bytes
-                    item = telemetry.TelemetryItem().parse(raw_item_bytes)
-                    startup_items.append(item)
-
-        # Construct the batch update
-        batch = telemetry.TelemetryBatchUpdate(
-            robot_id=robot_id,
-            updates=startup_items
-        )
-        
-        return bytes(batch)
+    def _deliver_state(self, robot_id: str, payload: bytes, entry_id: Optional[bytes] = None):
+        """Route one telemetry frame to the robot's startup snapshot and to every viewer here."""
+        snapshot = self.startup_snapshots.get(robot_id)
+        if snapshot is not None:
+            try:
+                snapshot.apply_frame(payload)
+            except ValueError as e:
+                logger.warning(f"Malformed state frame for {robot_id}: {e}")
+                self.startup_snapshots.pop(robot_id, None)
+        # Hand the frame to each viewer's writer task; never wait on a client here.
+        for ws in self.active_user_connections.get(robot_id, []):
+            held = self.replay_buffers.get(ws)
+            if held is not None:
+                held.append((entry_id, payload))
+                continue
+            queue = self.outbound.get(ws)
+            if queue is not None:
+                queue.put(payload)
 
     async def listen_to_redis(self):
         """
-        Background task with automatic reconnection logic to listen to robot state channel and
-        filter for bots that are connected to this instance.
+        Background task with automatic reconnection logic to listen to the state and command
+        channels of robots served by this instance (see SubscriptionManager), plus revocations.
         """
         retry_delay = 1
         while True:
             try:
                 psub = self.sub_redis.pubsub()
                 async with psub as p:
-                    await p.psubscribe("state:*", "commands:*", "revoke:*")
+                    # Revocations are rare and may concern any robot, so they stay a pattern.
+                    # Keeping this pattern also keeps listen() alive while no robot channels are held.
+                    await p.psubscribe("revoke:*")
+                    await self.subscriptions.attach(p)
                     logger.info("Redis Pub/Sub listener subscribed to channels.")
+                    # Subscribed first, so no ticket revocation falls between the two.
+                    await load_revocations(self.decoding_redis)
 
                     # Reset delay on successful subscription
                     retry_delay = 1
 
                     async for msg in p.listen():
-                        if msg["type"] != "pmessage":
+                        if msg["type"] not in ("message", "pmessage"):
                             continue
 
                         channel = msg["channel"].decode("utf-8")
@@ -196,14 +507,7 @@ class TelemetryManager:
                         prefix, rest = channel.split(":", 1)
 
                         if prefix == "state":
-                            robot_id = rest
-                            if robot_id in self.active_user_connections:
-                                for ws in self.active_user_connections[robot_id][:]:
-                                    try:
-                                        await ws.send_bytes(payload)
-                                    except Exception:
-                                        # Stale WS, cleanup handled by handle_user_connection
-                                        pass
+                            self._deliver_state(rest, payload)
 
                         elif prefix == "commands":
                             robot_id = rest
@@ -215,9 +519,13 @@ class TelemetryManager:
                                     pass
 
                         elif prefix == "revoke":
-                            # rest is the guest email; payload is the robot_id bytes
+                            # rest is the guest email (empty when access only changed); payload is the robot_id bytes
                             revoked_email = rest.lower()
                             robot_id = payload.decode("utf-8")
+                            access_cache.drop_local(robot_id)
+                            if not revoked_email:
+                                continue
+                            note_revocation(revoked_email, robot_id)
                             for ws in self.active_user_connections.get(robot_id, [])[:]:
                                 if self.user_email.get(ws) == revoked_email:
                                     logger.info(f"Booting revoked user {revoked_email} from {robot_id}")
@@ -227,6 +535,12 @@ class TelemetryManager:
                                         pass
 
             except Exception:
+                self.subscriptions.detach()
+                if self.transport == "pubsub":
+                    # Frames were missed while the listener was down, so reseed on the next connect.
+                    self.startup_snapshots.clear()
+                # Invalidations may have been missed too.
+                access_cache.clear_local()
                 # Log full traceback to identify why the listener died
                 logger.error(f"Telemetry listener crashed. Retrying in {retry_delay}s...\n{traceback.format_exc()}")
                 await asyncio.sleep(retry_delay)
@@ -0,0 +1,216 @@
+"""Per-robot ring-buffer recordings of raw telemetry frames, for post-mortem debugging.
+
+Each robot connected to this instance gets one fixed-size, memory-mapped file:
+
+    [file header][sparse time index][ring of records]
+
+Records are (payload length, sequence number, receive time, payload). When the ring is
+full the oldest records are overwritten. Appending is a couple of struct.pack_into calls
+and one memcpy into the mapping: no allocation for the payload and no syscalls, so it is
+cheap enough for the ingest hot path.
+
+The time index has one slot per fixed-size block of the ring, holding the first record
+that starts in that block. A reader binary-searches it to jump close to a timestamp and
+then walks forward, instead of scanning the ring from the oldest record.
+"""
+import logging
+import mmap
+import os
+import re
+import struct
+import time
+from bisect import bisect_right
+from typing import Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Directory for recordings. Unset (the default) disables recording.
+TELEMETRY_RECORD_DIR = os.getenv("TELEMETRY_RECORD_DIR", "")
+# Ring size per robot. At ~250 bytes per 30 Hz frame, 64 MiB holds roughly two and a half hours.
+TELEMETRY_RECORD_BYTES = int(os.getenv("TELEMETRY_RECORD_BYTES", str(64 * 1024 * 1024)))
+
+MAGIC = b"NFTR"
+VERSION = 1
+INDEX_SLOTS = 4096
+
+# magic, version, index slots, capacity, head, tail, head_seq, next_seq
+_FILE_HEADER = struct.Struct("<4sIIxxxxQQQQQ")
+_HEADER_BYTES = 64
+# seq, receive time, offset
+_INDEX_ENTRY = struct.Struct("<QdQ")
+# payload length, seq, receive time
+_RECORD_HEADER = struct.Struct("<IQd")
+_LENGTH = struct.Struct("<I")
+_WRAP = 0xFFFFFFFF
+
+
+def recording_path(robot_id: str, directory: str = TELEMETRY_RECORD_DIR) -> str:
+    safe_id = re.sub(r"[^A-Za-z0-9_.-]", "_", robot_id)
+    return os.path.join(directory, f"{safe_id}.nftr")
+
+
+class _Ring:
+    """Layout arithmetic and header access shared by the writer and the reader."""
+    def __init__(self, buf, index_slots: int, capacity: int):
+        self.buf = buf
+        self.index_slots = index_slots
+        self.capacity = capacity
+        self.data_start = _HEADER_BYTES + index_slots * _INDEX_ENTRY.size
+        self.block_size = -(-capacity // index_slots)
+
+    def _next_record(self, offset: int) -> Tuple[int, int, float, int]:
+        """Header of the record at or after offset (following a wrap). Returns (offset, length, seq, ts)."""
+        if self.capacity - offset < _RECORD_HEADER.size or _LENGTH.unpack_from(self.buf, self.data_start + offset)[0] == _WRAP:
+            offset = 0
+        length, seq, ts = _RECORD_HEADER.unpack_from(self.buf, self.data_start + offset)
+        return offset, length, seq, ts
+
+
+class TelemetryRecorder(_Ring):
+    """Appends raw frames for one robot to its ring file."""
+    def __init__(self, path: str, capacity: int = TELEMETRY_RECORD_BYTES, index_slots: int = INDEX_SLOTS):
+        data_start = _HEADER_BYTES + index_slots * _INDEX_ENTRY.size
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            os.ftruncate(fd, data_start + capacity)
+            buf = mmap.mmap(fd, data_start + capacity)
+        finally:
+            os.close(fd)  # the mapping keeps the file open
+        super().__init__(buf, index_slots, capacity)
+        # Always start a fresh recording; the previous session's file is overwritten in place.
+        self.head = self.tail = 0
+        self.head_seq = self.next_seq = 0
+        self.dropped = 0
+        self._last_block = -1
+        self.buf[_HEADER_BYTES:data_start] = bytes(index_slots * _INDEX_ENTRY.size)
+        self._write_header()
+
+    def _write_header(self):
+        _FILE_HEADER.pack_into(
+            self.buf, 0, MAGIC, VERSION, self.index_slots, self.capacity,
+            self.head, self.tail, self.head_seq, self.next_seq,
+        )
+
+    def _evict(self, start: int, end: int):
+        """Drop the oldest records until none starts inside [start, end) of the ring."""
+        while self.head_seq < self.next_seq:
+            # Follow a wrap first, so a head left at the end of a lap is seen at offset 0.
+            offset, length, _, _ = self._next_record(self.head)
+            self.head = offset
+            if not start <= offset < end:
+                return
+            self.head = offset + _RECORD_HEADER.size + length
+            self.head_seq += 1
+
+    def append(self, payload: bytes, received_at: Optional[float] = None):
+        size = _RECORD_HEADER.size + len(payload)
+        if size > self.capacity:
+            self.dropped += 1
+            return
+        if received_at is None:
+            received_at = time.time()
+        if self.head_seq == self.next_seq:
+            self.head = self.tail
+        if self.tail + size > self.capacity:
+            self._evict(self.tail, self.capacity)
+            if self.capacity - self.tail >= _LENGTH.size:
+                _LENGTH.pack_into(self.buf, self.data_start + self.tail, _WRAP)
+            self.tail = 0
+            self._last_block = -1
+            if self.head_seq == self.next_seq:
+                self.head = 0
+        self._evict(self.tail, self.tail + size)
+        if self.head_seq == self.next_seq:
+            # Everything live was evicted; the oldest record is the one written now.
+            self.head = self.tail
+
+        position = self.data_start + self.tail
+        _RECORD_HEADER.pack_into(self.buf, position, len(payload), self.next_seq, received_at)
+        self.buf[position + _RECORD_HEADER.size:position + size] = payload
+
+        block = self.tail // self.block_size
+        if block != self._last_block:
+            _INDEX_ENTRY.pack_into(self.buf, _HEADER_BYTES + block * _INDEX_ENTRY.size, self.next_seq, received_at, self.tail)
+            self._last_block = block
+
+        self.tail += size
+        self.next_seq += 1
+        self._write_header()
+
+    def close(self):
+        self.buf.flush()
+        self.buf.close()
+
+
+class TelemetryRecording(_Ring):
+    """
+    Read-only view of a ring file. Meant for post-mortem use; a file still being written
+    by a live recorder may be read, but records written meanwhile can tear the view.
+    """
+    def __init__(self, path: str):
+        self.file = open(path, "rb")
+        buf = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, index_slots, capacity, self.head, self.tail, self.head_seq, self.next_seq = _FILE_HEADER.unpack_from(buf, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a telemetry recording")
+        super().__init__(buf, index_slots, capacity)
+
+    def __len__(self) -> int:
+        return self.next_seq - self.head_seq
+
+    def _index(self) -> List[Tuple[float, int, int]]:
+        """Live index entries as (ts, seq, offset), oldest first."""
+        entries = []
+        for slot in range(self.index_slots):
+            seq, ts, offset = _INDEX_ENTRY.unpack_from(self.buf, _HEADER_BYTES + slot * _INDEX_ENTRY.size)
+            if not self.head_seq <= seq < self.next_seq or offset + _RECORD_HEADER.size > self.capacity:
+                continue
+            # A slot from an earlier lap may point into the middle of a newer record.
+            if _RECORD_HEADER.unpack_from(self.buf, self.data_start + offset)[1] == seq:
+                entries.append((ts, seq, offset))
+        entries.sort(key=lambda e: e[1])
+        return entries
+
+    def _iter_from(self, offset: int, seq: int) -> Iterator[Tuple[float, bytes]]:
+        while seq < self.next_seq:
+            offset, length, record_seq, ts = self._next_record(offset)
+            if record_seq != seq:
+                raise ValueError(f"Recording is inconsistent at seq {seq}")
+            start = self.data_start + offset + _RECORD_HEADER.size
+            yield ts, self.buf[start:start + length]
+            offset += _RECORD_HEADER.size + length
+            seq += 1
+
+    def frames(self, start_ts: Optional[float] = None, end_ts: Optional[float] = None) -> Iterator[Tuple[float, bytes]]:
+        """
+        Yield (receive time, serialized TelemetryBatchUpdate) from start_ts (inclusive) to
+        end_ts (exclusive), oldest first. Without start_ts, starts at the oldest record.
+        """
+        offset, seq = self.head, self.head_seq
+        if start_ts is not None:
+            index = self._index()
+            i = bisect_right([ts for ts, _, _ in index], start_ts) - 1
+            if i >= 0:
+                _, seq, offset = index[i]
+        for ts, frame in self._iter_from(offset, seq):
+            if start_ts is not None and ts < start_ts:
+                continue
+            if end_ts is not None and ts >= end_ts:
+                return
+            yield ts, frame
+
+    def close(self):
+        self.buf.close()
+        self.file.close()
+
+
+def open_recorder(robot_id: str) -> Optional[TelemetryRecorder]:
+    """A recorder for this robot's session, or None when recording is disabled or unavailable."""
+    if not TELEMETRY_RECORD_DIR:
+        return None
+    try:
+        os.makedirs(TELEMETRY_RECORD_DIR, exist_ok=True)
+        return TelemetryRecorder(recording_path(robot_id))
+    except OSError as e:
+        logger.error(f"Could not open telemetry recording for robot {robot_id}: {e}")
+        return None
@@ -0,0 +1,158 @@
+"""Minimal protobuf wire-format reader for TelemetryBatchUpdate frames.
+
+The ingest path only needs to know which items carry a retain_key, and the bytes of
+those items. Decoding the whole frame into betterproto2 dataclasses just for that is
+the most expensive thing the control plane does per robot frame, so this walks the
+tags directly and hands back memoryview slices into the original frame instead.
+
+The writer side goes the other way: a repeated message field is just a sequence of
+length-delimited records, so a batch can be assembled from stored item bytes by
+concatenation, with no decode/encode of the items themselves.
+
+Field numbers mirror telemetry.proto in nf_robot:
+    TelemetryBatchUpdate { string robot_id = 1; repeated TelemetryItem updates = 2; }
+    TelemetryItem { oneof payload { ... = 1..13, 15.. } optional string retain_key = 14; }
+    UplinkStatus { bool online = 1; }   (TelemetryItem.uplink_status = 15)
+"""
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+BATCH_ROBOT_ID = 1
+BATCH_UPDATES = 2
+ITEM_RETAIN_KEY = 14
+ITEM_UPLINK_STATUS = 15
+UPLINK_ONLINE = 1
+
+WIRETYPE_VARINT = 0
+WIRETYPE_FIXED64 = 1
+WIRETYPE_LENGTH_DELIMITED = 2
+WIRETYPE_FIXED32 = 5
+
+
+def read_varint(buf, pos: int) -> Tuple[int, int]:
+    """Decode a base-128 varint at pos. Returns (value, position after it)."""
+    result = 0
+    shift = 0
+    while True:
+        if pos >= len(buf):
+            raise ValueError("Truncated varint")
+        b = buf[pos]
+        pos += 1
+        result |= (b & 0x7F) << shift
+        if not b & 0x80:
+            return result, pos
+        shift += 7
+        if shift >= 64:
+            raise ValueError("Varint too long")
+
+
+def iter_fields(buf) -> Iterator[Tuple[int, int, int, int]]:
+    """
+    Walk the top-level fields of one serialized message.
+    Yields (field_number, wire_type, start, end); for length-delimited fields start:end
+    is the payload without its length prefix, for the other wire types it is the raw value.
+    """
+    pos = 0
+    end = len(buf)
+    while pos < end:
+        key, pos = read_varint(buf, pos)
+        field_number = key >> 3
+        wire_type = key & 0x7
+        if wire_type == WIRETYPE_VARINT:
+            start = pos
+            _, pos = read_varint(buf, pos)
+        elif wire_type == WIRETYPE_LENGTH_DELIMITED:
+            length, start = read_varint(buf, pos)
+            pos = start + length
+        elif wire_type == WIRETYPE_FIXED64:
+            start = pos
+            pos += 8
+        elif wire_type == WIRETYPE_FIXED32:
+            start = pos
+            pos += 4
+        else:
+            raise ValueError(f"Unsupported wire type {wire_type} for field {field_number}")
+        if pos > end:
+            raise ValueError(f"Field {field_number} runs past the end of the message")
+        yield field_number, wire_type, start, pos
+
+
+def iter_items(frame: bytes) -> Iterator[memoryview]:
+    """Yield each TelemetryItem of a serialized TelemetryBatchUpdate as a zero-copy slice."""
+    view = memoryview(frame)
+    for field_number, wire_type, start, end in iter_fields(view):
+        if field_number == BATCH_UPDATES and wire_type == WIRETYPE_LENGTH_DELIMITED:
+            yield view[start:end]
+
+
+def item_retain_key(item: memoryview) -> Optional[str]:
+    """The retain_key of one serialized TelemetryItem, or None if it has none."""
+    retain_key = None
+    for field_number, wire_type, start, end in iter_fields(item):
+        # Keep scanning: if the field repeats on the wire, the last occurrence wins, as in the parser.
+        if field_number == ITEM_RETAIN_KEY and wire_type == WIRETYPE_LENGTH_DELIMITED:
+            retain_key = str(item[start:end], "utf-8")
+    return retain_key
+
+
+def scan_retained(frame: bytes) -> List[Tuple[str, memoryview]]:
+    """
+    Find the items of a serialized TelemetryBatchUpdate that carry a retain_key.
+    Returns (retain_key, item_bytes) pairs where item_bytes is a memoryview into frame,
+    i.e. exactly the serialized TelemetryItem, ready to store without re-encoding.
+    """
+    retained = []
+    for item in iter_items(frame):
+        retain_key = item_retain_key(item)
+        if retain_key is not None:
+            retained.append((retain_key, item))
+    return retained
+
+
+def item_uplink_online(item: memoryview) -> Optional[bool]:
+    """If this TelemetryItem is an uplink_status update, whether it says online; otherwise None."""
+    online = None
+    for field_number, wire_type, start, end in iter_fields(item):
+        if field_number == ITEM_UPLINK_STATUS and wire_type == WIRETYPE_LENGTH_DELIMITED:
+            online = False  # an empty UplinkStatus is online=false
+            for sub_number, sub_type, sub_start, _ in iter_fields(item[start:end]):
+                if sub_number == UPLINK_ONLINE and sub_type == WIRETYPE_VARINT:
+                    online = read_varint(item[start:end], sub_start)[0] != 0
+    return online
+
+
+def encode_varint(value: int) -> bytes:
+    out = bytearray()
+    while True:
+        b = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(b | 0x80)
+        else:
+            out.append(b)
+            return bytes(out)
+
+
+def _length_delimited(field_number: int, payload) -> bytes:
+    return encode_varint((field_number << 3) | WIRETYPE_LENGTH_DELIMITED) + encode_varint(len(payload))
+
+
+def encode_batch(robot_id: str, items: Iterable[bytes]) -> bytes:
+    """
+    Serialize a TelemetryBatchUpdate from already-serialized TelemetryItems.
+    Parses to the same message as building the batch with betterproto2 and calling bytes().
+    """
+    parts = []
+    if robot_id:
+        robot_id_bytes = robot_id.encode("utf-8")
+        parts.append(_length_delimited(BATCH_ROBOT_ID, robot_id_bytes))
+        parts.append(robot_id_bytes)
+    for item in items:
+        parts.append(_length_delimited(BATCH_UPDATES, item))
+        parts.append(item)
+    return b"".join(parts)
+
+
+def encode_uplink_item(online: bool) -> bytes:
+    """Serialized TelemetryItem(uplink_status=UplinkStatus(online=online))."""
+    status = bytes([UPLINK_ONLINE << 3 | WIRETYPE_VARINT, 1]) if online else b""
+    return _length_delimited(ITEM_UPLINK_STATUS, status) + status
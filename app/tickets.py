@@ -1,36 +1,48 @@
+import base64
+import hashlib
+import hmac
 import json
 import logging
+import os
 import secrets
+import time
 
 logger = logging.getLogger(__name__)
 
 _TICKET_PREFIX = "ticket:"
-_USER_ROBOT_TICKETS_PREFIX = "user_robot_tickets:"
+_TICKET_REVOKED_PREFIX = "ticket_revoked:"
+
+# When set, create_ticket issues signed tickets that are validated without Redis
+# (see sign_ticket). Every instance must share the same secret.
+STREAM_TICKET_SECRET = os.getenv("STREAM_TICKET_SECRET", "")
+_SIGNED_TICKET_PREFIX = "st2."
 
 # Stream tickets are redeemed within seconds of being issued (the client fetches
 # one immediately before opening a WHEP/control connection). A short TTL caps the
 # damage window if a ticket leaks (e.g. via proxy/CDN access logs, since it rides
-# in the URL query string) and guarantees expiry even if the session-disconnect
-# cleanup in delete_user_robot_tickets never runs (worker crash, Redis failover).
+# in the URL query string). Tickets are not deleted when the session ends: the
+# stream webhook already requires a live /control connection (see PresenceRegistry),
+# so they simply expire.
 _TICKET_TTL_SECONDS = 60
 
 
 async def create_ticket(redis_conn, user_id: str, user_email: str, robot_id: str) -> str:
+    if STREAM_TICKET_SECRET:
+        return sign_ticket(user_id, user_email, robot_id)
     ticket_id = secrets.token_urlsafe(32)
     ticket_data = json.dumps({
         "user_id": user_id,
         "user_email": user_email or "",
         "robot_id": robot_id,
     })
-    pipe = redis_conn.pipeline()
-    pipe.set(f"{_TICKET_PREFIX}{ticket_id}", ticket_data, ex=_TICKET_TTL_SECONDS)
-    pipe.sadd(f"{_USER_ROBOT_TICKETS_PREFIX}{user_id}:{robot_id}", ticket_id)
-    await pipe.execute()
+    await redis_conn.set(f"{_TICKET_PREFIX}{ticket_id}", ticket_data, ex=_TICKET_TTL_SECONDS)
     logger.info(f"Created stream ticket for user {user_id} on robot {robot_id} (TTL={_TICKET_TTL_SECONDS}s)")
     return ticket_id
 
 
 async def get_ticket(redis_conn, ticket_id: str) -> dict | None:
+    if is_signed_ticket(ticket_id):
+        return verify_signed_ticket(ticket_id)
     data = await redis_conn.get(f"{_TICKET_PREFIX}{ticket_id}")
     if not data:
         return None
@@ -40,8 +52,7 @@ async def get_ticket(redis_conn, ticket_id: str) -> dict | None:
 async def create_batch_ticket(redis_conn, user_id: str, user_email: str, robot_id: str, ttl_seconds: int = 7200) -> str:
     """Creates a ticket for a cloud batch job.
 
-    Unlike create_ticket, this ticket is NOT added to the user_robot_tickets set,
-    so it is never deleted when the user's WebSocket session disconnects.
+    Unlike create_ticket, this ticket lives for the whole job rather than a minute.
     It expires automatically via Redis TTL.
     """
     ticket_id = secrets.token_urlsafe(32)
@@ -55,14 +66,120 @@ async def create_batch_ticket(redis_conn, user_id: str, user_email: str, robot_i
     return ticket_id
 
 
-async def delete_user_robot_tickets(redis_conn, user_id: str, robot_id: str):
-    ticket_set_key = f"{_USER_ROBOT_TICKETS_PREFIX}{user_id}:{robot_id}"
-    ticket_ids = await redis_conn.smembers(ticket_set_key)
-    if not ticket_ids:
+# --- Signed tickets ---
+#
+# "st2.<payload>.<signature>": the payload is base64url JSON with the user_id, email,
+# robot_id, issue time in ms and expiry; the signature is an HMAC-SHA256 over the payload.
+# Checking one is a few microseconds of CPU, with no Redis or Firebase round trip.
+#
+# Signed tickets can't be deleted, so revoking a guest's access revokes their tickets for
+# the robot instead: tickets issued before the revocation are refused. Every instance
+# learns of it from the 'revoke:{email}' message that already boots the guest (see
+# TelemetryManager.listen_to_redis) and keeps it in memory, which is all get_ticket checks.
+# record_revocation also leaves a copy in Redis for the ticket TTL, which load_revocations
+# reads when the listener (re)subscribes, covering messages it wasn't there to receive.
+
+# (user_email, robot_id) -> revoked_at_ms
+_revoked_local: dict[tuple[str, str], int] = {}
+
+
+def is_signed_ticket(ticket_id: str) -> bool:
+    return ticket_id.startswith(_SIGNED_TICKET_PREFIX)
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _signature(payload: str) -> str:
+    return _b64encode(hmac.new(STREAM_TICKET_SECRET.encode(), payload.encode("ascii"), hashlib.sha256).digest())
+
+
+def sign_ticket(user_id: str, user_email: str, robot_id: str, ttl_seconds: int = _TICKET_TTL_SECONDS) -> str:
+    issued_ms = int(time.time() * 1000)
+    payload = _b64encode(json.dumps({
+        "u": user_id,
+        "e": (user_email or "").lower(),
+        "r": robot_id,
+        "iat": issued_ms,
+        "exp": issued_ms // 1000 + ttl_seconds,
+    }, separators=(",", ":")).encode())
+    logger.info(f"Created signed stream ticket for user {user_id} on robot {robot_id} (TTL={ttl_seconds}s)")
+    return f"{_SIGNED_TICKET_PREFIX}{payload}.{_signature(payload)}"
+
+
+def verify_signed_ticket(ticket_id: str) -> dict | None:
+    """
+    The ticket's contents if its signature is valid, it hasn't expired and it hasn't been
+    revoked; None otherwise. Never touches Redis.
+    """
+    if not STREAM_TICKET_SECRET or not is_signed_ticket(ticket_id):
+        return None
+    payload, _, signature = ticket_id[len(_SIGNED_TICKET_PREFIX):].partition(".")
+    try:
+        # As bytes: compare_digest raises TypeError for a str with non-ASCII characters,
+        # and a non-ASCII payload fails to encode in _signature (UnicodeError is a ValueError).
+        if not hmac.compare_digest(signature.encode(), _signature(payload).encode()):
+            return None
+        claims = json.loads(_b64decode(payload))
+        if time.time() >= claims["exp"]:
+            return None
+        if claims["iat"] < _revoked_local.get((claims["e"], claims["r"]), 0):
+            return None
+        return {
+            "user_id": claims["u"],
+            "user_email": claims["e"],
+            "robot_id": claims["r"],
+            "issued_ms": claims["iat"],
+        }
+    except (ValueError, TypeError, KeyError):
+        # Whatever arrived in the query string, a ticket that doesn't parse is just invalid.
+        return None
+
+
+def ticket_email_matches(ticket: dict, email: str) -> bool:
+    """Whether the ticket was issued to email."""
+    return ticket.get("user_email", "").lower() == (email or "").lower()
+
+
+def _revocation_key(user_email: str, robot_id: str) -> str:
+    return f"{_TICKET_REVOKED_PREFIX}{robot_id}:{user_email.lower()}"
+
+
+def note_revocation(user_email: str, robot_id: str, revoked_ms: int | None = None):
+    """Refuse signed tickets issued to user_email for robot_id before revoked_ms (default: now)."""
+    if revoked_ms is None:
+        revoked_ms = int(time.time() * 1000) + 1
+    if len(_revoked_local) > 10000:
+        # Entries older than a ticket's lifetime can't refuse anything any more.
+        oldest = revoked_ms - _TICKET_TTL_SECONDS * 1000
+        for key in [k for k, v in _revoked_local.items() if v < oldest]:
+            del _revoked_local[key]
+    key = (user_email.lower(), robot_id)
+    _revoked_local[key] = max(revoked_ms, _revoked_local.get(key, 0))
+
+
+def record_revocation(pipe, user_email: str, robot_id: str):
+    """Queue on pipe the Redis copy of a revocation, for instances that miss its 'revoke:' message."""
+    if STREAM_TICKET_SECRET and user_email:
+        revoked_ms = int(time.time() * 1000) + 1
+        pipe.set(_revocation_key(user_email, robot_id), revoked_ms, ex=_TICKET_TTL_SECONDS)
+
+
+async def load_revocations(redis_conn):
+    """Copy the revocations still in Redis into memory. Expects a decode_responses client."""
+    if not STREAM_TICKET_SECRET:
+        return
+    keys = [key async for key in redis_conn.scan_iter(match=f"{_TICKET_REVOKED_PREFIX}*", count=1000)]
+    if not keys:
         return
-    pipe = redis_conn.pipeline()
-    for ticket_id in ticket_ids:
-        pipe.delete(f"{_TICKET_PREFIX}{ticket_id}")
-    pipe.delete(ticket_set_key)
-    await pipe.execute()
-    logger.info(f"Deleted {len(ticket_ids)} stream ticket(s) for user {user_id} on robot {robot_id}")
+    for key, revoked_ms in zip(keys, await redis_conn.mget(keys)):
+        if revoked_ms is None:
+            continue  # expired since the SCAN
+        robot_id, _, user_email = key[len(_TICKET_REVOKED_PREFIX):].partition(":")
+        note_revocation(user_email, robot_id, int(revoked_ms))
+    logger.info(f"Loaded {len(keys)} stream ticket revocation(s) from Redis")
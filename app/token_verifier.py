@@ -0,0 +1,88 @@
+import asyncio
+import hashlib
+import os
+import time
+from typing import Dict, Tuple
+
+from .lazy_imports import firebase_auth
+from .sdk_calls import firebase_calls
+
+# How often each user's revocation / disabled state is re-read from Firebase. A token
+# revoked in between keeps working for at most this long on this instance.
+REVOCATION_CHECK_SECONDS = int(os.getenv("REVOCATION_CHECK_SECONDS", "300"))
+# Upper bound on cached tokens; expired entries are pruned first when it is reached.
+TOKEN_CACHE_MAX = int(os.getenv("TOKEN_CACHE_MAX", "10000"))
+
+
+class TokenVerifier:
+    """
+    Verifies Firebase ID tokens without a Firebase round trip per request.
+
+    Signatures are checked locally by the Admin SDK (verify_id_token without
+    check_revoked), which caches Google's public keys for as long as their Cache-Control
+    allows. The decoded claims are then cached by token hash until the token's exp, so a
+    UI polling /listrobots verifies its token once, not on every call.
+
+    Revocation is what needs the network: it is checked per uid, at most once every
+    REVOCATION_CHECK_SECONDS, with the blocking get_user call run on the Firebase executor.
+    Concurrent requests for the same uid share one lookup.
+    """
+    def __init__(self):
+        self.claims: Dict[str, Tuple[dict, float]] = {}  # sha256(token) -> (claims, exp)
+        self.user_state: Dict[str, Tuple[float, bool, float]] = {}  # uid -> (valid_after_ms, disabled, checked_at)
+        self._lookups: Dict[str, asyncio.Future] = {}  # uid -> in-flight revocation lookup
+
+    async def verify(self, token: str) -> dict:
+        """
+        Decoded claims of a valid, unexpired, unrevoked token. Raises the same Firebase
+        exceptions as firebase_auth.verify_id_token(token, check_revoked=True).
+        """
+        key = hashlib.sha256(token.encode("utf-8")).hexdigest()
+        cached = self.claims.get(key)
+        if cached and time.time() < cached[1]:
+            claims = cached[0]
+        else:
+            self.claims.pop(key, None)
+            # Local unless the public keys are due a refresh, which is an HTTP fetch.
+            claims = await firebase_calls.run(firebase_auth.verify_id_token, token)
+            self._remember(key, claims)
+        await self._check_revoked(claims)
+        # Callers annotate the claims (e.g. with roles); keep the cached copy clean.
+        return dict(claims)
+
+    def _remember(self, key: str, claims: dict):
+        if len(self.claims) >= TOKEN_CACHE_MAX:
+            now = time.time()
+            for stale in [k for k, (_, exp) in self.claims.items() if exp <= now]:
+                del self.claims[stale]
+            if len(self.claims) >= TOKEN_CACHE_MAX:
+                self.claims.pop(next(iter(self.claims)))  # oldest insertion
+        self.claims[key] = (claims, float(claims["exp"]))
+
+    async def _check_revoked(self, claims: dict):
+        uid = claims["uid"]
+        state = self.user_state.get(uid)
+        if state is None or time.monotonic() - state[2] >= REVOCATION_CHECK_SECONDS:
+            state = await self._refresh_user_state(uid)
+        valid_after_ms, disabled, _ = state
+        if disabled:
+            raise firebase_auth.UserDisabledError("The user record is disabled.")
+        if claims["iat"] * 1000 < valid_after_ms:
+            raise firebase_auth.RevokedIdTokenError("The Firebase ID token has been revoked.")
+
+    async def _refresh_user_state(self, uid: str) -> Tuple[float, bool, float]:
+        lookup = self._lookups.get(uid)
+        if lookup is None:
+            lookup = asyncio.ensure_future(self._fetch_user_state(uid))
+            self._lookups[uid] = lookup
+            lookup.add_done_callback(lambda _: self._lookups.pop(uid, None))
+        return await asyncio.shield(lookup)
+
+    async def _fetch_user_state(self, uid: str) -> Tuple[float, bool, float]:
+        user = await firebase_calls.run(firebase_auth.get_user, uid)
+        state = (user.tokens_valid_after_timestamp or 0, user.disabled, time.monotonic())
+        self.user_state[uid] = state
+        return state
+
+
+token_verifier = TokenVerifier()
@@ -0,0 +1,138 @@
+import logging
+import os
+import time
+from typing import Optional
+
+import httpx
+from fastapi import HTTPException
+
+from .sdk_calls import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+# When set (prod only), auth requests containing staging=1 are forwarded here instead of being handled locally.
+STAGING_CONTROL_PLANE_URL = os.environ.get("STAGING_CONTROL_PLANE_URL", "")
+STAGING_TIMEOUT_SECONDS = float(os.getenv("STAGING_TIMEOUT_SECONDS", "10"))
+HUGGINGFACE_URL = "https://huggingface.co"
+HUGGINGFACE_TIMEOUT_SECONDS = float(os.getenv("HUGGINGFACE_TIMEOUT_SECONDS", "10"))
+
+# Consecutive failures (transport errors or 5xx) that open an upstream's circuit,
+# and how long it then stays open before one trial request is let through.
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_RESET_SECONDS = 30
+
+
+class UpstreamClient:
+    """
+    One long-lived httpx client per upstream HTTP service, so requests reuse pooled
+    keep-alive (HTTP/2 where the server offers it) connections instead of paying TCP+TLS
+    setup each time. start() and close() are called from the app's startup/shutdown.
+
+    A circuit breaker stops calling an upstream that keeps failing: after
+    CIRCUIT_FAILURE_THRESHOLD consecutive failures, requests fail fast with a 503 for
+    CIRCUIT_RESET_SECONDS, then a single trial request decides whether it closes again.
+    Requests, new connections (the rest reused a pooled one) and latency are counted.
+    """
+    def __init__(self, name: str, base_url: str, timeout: float, max_connections: int = 20):
+        self.name = name
+        self.base_url = base_url
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.client: Optional[httpx.AsyncClient] = None
+        self.latency = LatencyHistogram()
+        self.requests = 0
+        self.new_connections = 0
+        self.errors = 0
+        self.rejected = 0
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.trial_in_flight = False
+
+    def start(self):
+        if self.client is None:
+            self.client = httpx.AsyncClient(
+                base_url=self.base_url,
+                http2=True,
+                timeout=httpx.Timeout(self.timeout, connect=min(self.timeout, 5.0)),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                    keepalive_expiry=60,
+                ),
+            )
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """Send a request through the pooled client. Raises HTTPException(503) while the circuit is open."""
+        self._admit()
+        self.start()  # for calls made outside the app's lifecycle, e.g. from scripts
+        self.requests += 1
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, extensions={"trace": self._trace}, **kwargs)
+        except httpx.TransportError as e:
+            self._failed(f"{type(e).__name__}: {e}")
+            raise
+        except BaseException:
+            self.trial_in_flight = False  # e.g. cancelled; let the next request try instead
+            raise
+        finally:
+            self.latency.observe(time.perf_counter() - start)
+        if response.status_code >= 500:
+            self._failed(f"HTTP {response.status_code}")
+        else:
+            self._succeeded()
+        return response
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    def _admit(self):
+        if not self.open_until:
+            return
+        if time.monotonic() < self.open_until or self.trial_in_flight:
+            self.rejected += 1
+            raise HTTPException(status_code=503, detail=f"{self.name} is unavailable")
+        self.trial_in_flight = True  # half-open: this request decides
+
+    def _succeeded(self):
+        self.consecutive_failures = 0
+        if self.open_until:
+            logger.info(f"{self.name} circuit closed")
+        self.open_until = 0.0
+        self.trial_in_flight = False
+
+    def _failed(self, reason: str):
+        self.errors += 1
+        self.consecutive_failures += 1
+        self.trial_in_flight = False
+        if self.open_until or self.consecutive_failures >= CIRCUIT_FAILURE_THRESHOLD:
+            self.open_until = time.monotonic() + CIRCUIT_RESET_SECONDS
+            logger.warning(f"{self.name} circuit open for {CIRCUIT_RESET_SECONDS}s after {self.consecutive_failures} failures ({reason})")
+
+    async def _trace(self, event_name: str, info: dict):
+        if event_name == "connection.connect_tcp.complete":
+            self.new_connections += 1
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "new_connections": self.new_connections,
+            "reused_connections": max(0, self.requests - self.new_connections),
+            "errors": self.errors,
+            "rejected": self.rejected,
+            "circuit_open": self.open_until > time.monotonic(),
+            "latency": self.latency.snapshot(),
+        }
+
+
+staging_upstream = UpstreamClient("staging control plane", STAGING_CONTROL_PLANE_URL, STAGING_TIMEOUT_SECONDS)
+huggingface_upstream = UpstreamClient("huggingface", HUGGINGFACE_URL, HUGGINGFACE_TIMEOUT_SECONDS)
+UPSTREAMS = (staging_upstream, huggingface_upstream)
@@ -0,0 +1,85 @@
+"""Report what importing app.main costs, and fail if it goes over budget.
+
+Run from the repository root:
+
+    python -m benchmarks.import_budget [--budget-ms 1500] [--runs 5] [--top 25]
+
+Imports app.main in fresh interpreters with -X importtime and keeps the fastest run
+(the least disturbed by the machine). It prints the costliest modules by cumulative
+time and every app.* module, and exits non-zero when either:
+
+- the cold import of app.main takes longer than the budget (IMPORT_BUDGET_MS or --budget-ms), or
+- a module that is meant to load lazily (see app.lazy_imports) was imported eagerly.
+
+This is the cold-start regression check; cloudbuild-step1.yaml runs it after the tests.
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+DEFAULT_BUDGET_MS = float(os.getenv("IMPORT_BUDGET_MS", "1500"))
+# Modules that only load on first use; importing app.main must not pull them in.
+DEFERRED_MODULES = ("firebase_admin", "stripe", "numpy", "markdown", "frontmatter", "app.simulation_manager")
+
+
+def import_profile() -> list:
+    """[(cumulative_us, self_us, depth, module)] for one cold import of app.main, in import order."""
+    env = dict(os.environ)
+    # The engine is created at import time but doesn't connect, so any URL will do.
+    env.setdefault("DATABASE_URL", "postgresql+asyncpg://budget@localhost/budget")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        env=env, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        sys.exit(f"importing app.main failed:\n{result.stderr[-2000:]}")
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or line.endswith("imported package"):
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        if not self_us.strip().isdigit():
+            continue  # the header line
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((int(cumulative_us), int(self_us), depth, name.strip()))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=25)
+    args = parser.parse_args()
+
+    profiles = [import_profile() for _ in range(args.runs)]
+    total_ms = {id(p): next(c for c, _, _, name in p if name == "app.main") / 1000 for p in profiles}
+    profile = min(profiles, key=lambda p: total_ms[id(p)])
+    best_ms = total_ms[id(profile)]
+
+    print(f"{'cumulative ms':>14}{'self ms':>10}  module")
+    for cumulative, self_us, depth, name in sorted(profile, reverse=True)[:args.top]:
+        print(f"{cumulative / 1000:>14.1f}{self_us / 1000:>10.1f}  {'  ' * depth}{name}")
+    print("\napp modules:")
+    for cumulative, self_us, depth, name in profile:
+        if name.startswith("app."):
+            print(f"{cumulative / 1000:>14.1f}{self_us / 1000:>10.1f}  {name}")
+
+    runs_ms = sorted(total_ms.values())
+    print(f"\nimport app.main: {best_ms:.0f} ms (best of {args.runs}; all runs {', '.join(f'{ms:.0f}' for ms in runs_ms)}), budget {args.budget_ms:.0f} ms")
+
+    failures = []
+    imported = {name for _, _, _, name in profile}
+    eager = [m for m in DEFERRED_MODULES if m in imported]
+    if eager:
+        failures.append(f"imported eagerly, should load lazily: {', '.join(eager)}")
+    if best_ms > args.budget_ms:
+        failures.append(f"import app.main took {best_ms:.0f} ms, over the {args.budget_ms:.0f} ms budget")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Check and time the columnar pos_estimate decoder against betterproto2.
+
+Run from the repository root:
+
+    python -m benchmarks.pos_estimate_columns
+
+Decodes a stream of 30 Hz physics frames with app.telemetry_columns and compares every
+column with the same values read from fully parsed betterproto2 messages, then times
+both over an hour of frames and the RMS helpers over a million samples.
+"""
+import time
+
+import numpy as np
+from nf_robot.generated.nf import telemetry, common
+
+from app.telemetry_columns import (
+    decode_pos_estimates,
+    vec3_column,
+    rms_deviation_from_line,
+    rms_deviation_from_path,
+)
+from benchmarks.telemetry_scan import physics_frame, conn_status_frame
+
+
+def objects_path(frames) -> list:
+    """The obvious way: parse every frame and keep the PositionEstimate objects."""
+    estimates = []
+    for frame in frames:
+        for item in telemetry.TelemetryBatchUpdate().parse(frame).updates:
+            if item.pos_estimate is not None:
+                estimates.append(item.pos_estimate)
+    return estimates
+
+
+def _vec3_values(vec) -> list:
+    return [np.nan] * 3 if vec is None else [vec.x, vec.y, vec.z]
+
+
+def check_equivalent(frames):
+    samples = decode_pos_estimates(frames)
+    estimates = objects_path(frames)
+    assert len(samples) == len(estimates)
+    for row, est in zip(samples, estimates):
+        pose = est.gripper_pose
+        expected = [est.data_ts]
+        expected += _vec3_values(est.gantry_position) + _vec3_values(est.gantry_velocity)
+        expected += _vec3_values(pose and pose.rotation) + _vec3_values(pose and pose.position)
+        actual = [float(row[name]) for name in samples.dtype.names[:len(expected)]]
+        np.testing.assert_array_equal(np.float32(actual[1:]), np.float32(expected[1:]))
+        assert actual[0] == expected[0]
+        assert [bool(row[f"slack_{i}"]) for i in range(len(est.slack))] == est.slack
+
+
+def edge_frames() -> list:
+    """Missing sub-messages, all-default values and odd slack lengths."""
+    estimates = [
+        telemetry.PositionEstimate(),
+        telemetry.PositionEstimate(gantry_position=common.Vec3(), data_ts=1.5),
+        telemetry.PositionEstimate(gripper_pose=common.Pose(position=common.Vec3(x=1.0)), slack=[True, False, True]),
+    ]
+    return [
+        bytes(telemetry.TelemetryBatchUpdate(robot_id="r", updates=[telemetry.TelemetryItem(pos_estimate=est)]))
+        for est in estimates
+    ]
+
+
+def main():
+    frames = [physics_frame() for _ in range(1000)] + [conn_status_frame()] + edge_frames()
+    check_equivalent(frames)
+    print("columns match betterproto2")
+
+    hour = [physics_frame() for _ in range(30 * 3600)]
+    start = time.perf_counter()
+    objects_path(hour)
+    objects_s = time.perf_counter() - start
+    start = time.perf_counter()
+    samples = decode_pos_estimates(hour)
+    columns_s = time.perf_counter() - start
+    print(f"{len(hour)} frames: betterproto2 objects {objects_s:.2f}s, columns {columns_s:.2f}s ({objects_s / columns_s:.1f}x)")
+
+    points = np.resize(vec3_column(samples, "gantry_position"), (1_000_000, 3))
+    start = time.perf_counter()
+    rms_deviation_from_line(points, (-2.5, -2.5, 1.0), (2.5, 2.5, 1.0))
+    line_s = time.perf_counter() - start
+    path = np.array([(-2.5, -2.5, 1.0), (2.5, -2.5, 1.0), (2.5, 2.5, 1.0), (-2.5, 2.5, 1.0)])
+    start = time.perf_counter()
+    rms_deviation_from_path(points, path)
+    path_s = time.perf_counter() - start
+    print(f"{len(points)} samples: RMS from line {line_s * 1e3:.0f}ms, from {len(path) - 1}-segment path {path_s * 1e3:.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
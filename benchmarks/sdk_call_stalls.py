@@ -0,0 +1,126 @@
+"""Show that slow Firebase/Stripe SDK calls no longer stall telemetry relay.
+
+Run from the repository root (the database is never connected to, so any URL will do):
+
+    DATABASE_URL=postgresql+asyncpg://bench@localhost/bench python -m benchmarks.sdk_call_stalls
+
+Robot frames go through the real relay path at 30 Hz: TelemetryManager._deliver_state
+hands each to the viewer's OutboundQueue, whose writer task sends it on the viewer's
+socket, where how late it arrived is recorded. Meanwhile, stand-ins for
+firebase_auth.get_user and checkout.sessions.create block their thread for hundreds of
+milliseconds, as the real SDKs do on a slow network. The calls are made directly on the
+event loop, as the handlers used to, and then through app.sdk_calls' firebase_calls and
+stripe_calls. tests/test_sdk_call_stalls.py asserts on the same scenarios.
+"""
+import asyncio
+import time
+
+from nf_robot.generated.nf import telemetry
+
+from app.outbound_queue import OutboundQueue
+from app.sdk_calls import firebase_calls, stripe_calls
+from app.telemetry_manager import TelemetryManager
+
+FRAME_INTERVAL = 1 / 30
+RUN_SECONDS = 3.0
+ROBOT_ID = "bench_robot"
+# Concurrent callers per service, more than its executor has workers, so some also wait for a slot.
+SLOW_CALLERS = 12
+
+
+def fake_get_user(uid: str):
+    time.sleep(0.3)
+    return {"uid": uid}
+
+
+def fake_create_checkout_session(params: dict):
+    time.sleep(0.5)
+    return {"client_secret": "cs_test"}
+
+
+def frame_due_at(due: float) -> bytes:
+    """A pos_estimate frame carrying the perf_counter time it should be delivered by."""
+    pos_est = telemetry.PositionEstimate(data_ts=due)
+    return bytes(telemetry.TelemetryBatchUpdate(robot_id=ROBOT_ID, updates=[telemetry.TelemetryItem(pos_estimate=pos_est)]))
+
+
+class LatenessRecorder:
+    """Stands in for a viewer's websocket; records how late each frame arrives."""
+    def __init__(self, lateness: list):
+        self.lateness = lateness
+
+    async def send_bytes(self, data: bytes):
+        due = telemetry.TelemetryBatchUpdate().parse(data).updates[0].pos_estimate.data_ts
+        self.lateness.append(time.perf_counter() - due)
+
+
+async def relay(lateness: list):
+    """Robot frames in through the listener's delivery path, out through the viewer's writer task."""
+    manager = TelemetryManager()
+    viewer = LatenessRecorder(lateness)
+    queue = OutboundQueue(viewer)
+    queue.start()
+    manager.outbound[viewer] = queue
+    manager.active_user_connections[ROBOT_ID] = [viewer]
+    next_at = time.perf_counter()
+    try:
+        while True:
+            manager._deliver_state(ROBOT_ID, frame_due_at(next_at))
+            next_at += FRAME_INTERVAL
+            await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+    finally:
+        queue.stop()
+
+
+async def slow_calls(call, callers: int):
+    async def caller(fn, *args, **kwargs):
+        while True:
+            await call(fn, *args, **kwargs)
+            await asyncio.sleep(0.1)
+
+    await asyncio.gather(
+        *(caller(fake_get_user, "uid") for _ in range(callers)),
+        *(caller(fake_create_checkout_session, params={}) for _ in range(callers)),
+    )
+
+
+async def scenario(call, seconds: float = RUN_SECONDS, callers: int = SLOW_CALLERS) -> list:
+    """Sorted delivery lateness of every frame relayed while call() runs the slow SDK stand-ins."""
+    lateness = []
+    tasks = [asyncio.create_task(relay(lateness))]
+    if call:
+        tasks.append(asyncio.create_task(slow_calls(call, callers)))
+    await asyncio.sleep(seconds)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return sorted(lateness)
+
+
+async def on_loop(fn, *args, **kwargs):
+    return fn(*args, **kwargs)
+
+
+async def via_executors(fn, *args, **kwargs):
+    executor = firebase_calls if fn is fake_get_user else stripe_calls
+    return await executor.run(fn, *args, **kwargs)
+
+
+async def main():
+    print(f"{'scenario':<28}{'frames':>8}{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    # On the event loop the calls run one after another anyway; more callers would only
+    # stretch the stall past the end of the run.
+    for name, call, callers in (
+        ("idle", None, 0),
+        ("SDK calls on event loop", on_loop, 1),
+        ("SDK calls via sdk_calls", via_executors, SLOW_CALLERS),
+    ):
+        lateness = await scenario(call, callers=callers)
+        p50 = lateness[len(lateness) // 2] * 1e3
+        p99 = lateness[int(len(lateness) * 0.99)] * 1e3
+        print(f"{name:<28}{len(lateness):>8}{p50:>9.1f}{p99:>9.1f}{lateness[-1] * 1e3:>9.1f}")
+    print(f"firebase latency histogram: {firebase_calls.stats()['latency']}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,57 @@
+"""Time the byte-level startup batch encoder against betterproto2.
+
+Run from the repository root:
+
+    python -m benchmarks.startup_batch
+
+Times batches built by app.telemetry_wire.encode_batch against the same batch built the
+old way (parse every retained item, then re-serialize the whole batch). That the two
+decode identically is checked by tests/test_startup_batch.py.
+"""
+import timeit
+
+from nf_robot.generated.nf import telemetry, common
+
+from app.telemetry_wire import encode_batch, encode_uplink_item, scan_retained
+from benchmarks.telemetry_scan import physics_frame, conn_status_frame, target_list_frame
+
+
+def anchor_poses_item() -> bytes:
+    poses = [
+        common.Pose(rotation=common.Vec3(x=0.1 * i, y=0.2, z=3.1), position=common.Vec3(x=2.5, y=-2.5, z=2.5))
+        for i in range(4)
+    ]
+    return bytes(telemetry.TelemetryItem(new_anchor_poses=telemetry.AnchorPoses(poses=poses), retain_key="anchor_poses"))
+
+
+def retained_items(n_targets: int) -> list:
+    items = [anchor_poses_item()]
+    for frame in (physics_frame(), conn_status_frame(), target_list_frame(n_targets)):
+        items.extend(bytes(item) for _, item in scan_retained(frame))
+    return items
+
+
+def reserialize_path(robot_id: str, online: bool, items: list) -> bytes:
+    """What get_startup_state used to do on every UI connect."""
+    startup_items = [telemetry.TelemetryItem(uplink_status=telemetry.UplinkStatus(online=online))]
+    startup_items.extend(telemetry.TelemetryItem().parse(raw) for raw in items)
+    return bytes(telemetry.TelemetryBatchUpdate(robot_id=robot_id, updates=startup_items))
+
+
+def concat_path(robot_id: str, online: bool, items: list) -> bytes:
+    return encode_batch(robot_id, [encode_uplink_item(online), *items])
+
+
+def main():
+    print(f"{'targets':>8}{'bytes':>9}{'reserialize us':>16}{'concat us':>12}{'speedup':>10}")
+    for n_targets in (0, 50, 500):
+        items = retained_items(n_targets)
+        size = len(concat_path("bench_robot", True, items))
+        number = 200 if n_targets < 100 else 20
+        old_us = min(timeit.repeat(lambda: reserialize_path("bench_robot", True, items), number=number, repeat=5)) / number * 1e6
+        new_us = min(timeit.repeat(lambda: concat_path("bench_robot", True, items), number=number, repeat=5)) / number * 1e6
+        print(f"{n_targets:>8}{size:>9}{old_us:>16.1f}{new_us:>12.1f}{old_us / new_us:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
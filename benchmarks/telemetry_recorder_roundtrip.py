@@ -0,0 +1,68 @@
+"""Check that telemetry ring recordings read back exactly what was appended.
+
+Run from the repository root:
+
+    python -m benchmarks.telemetry_recorder_roundtrip [--runs 400]
+
+Each run appends random-length frames to a small ring (a few hundred bytes, so frames
+of up to a ring's size wrap and evict constantly) and after every append checks that
+TelemetryRecording.frames() yields exactly the most recent frames that still fit, in order.
+"""
+import argparse
+import os
+import random
+import tempfile
+
+from app.telemetry_recorder import TelemetryRecorder, TelemetryRecording, _RECORD_HEADER
+
+
+def run_once(rng: random.Random, path: str, appends: int = 200):
+    capacity = rng.randint(200, 257)
+    max_frame = rng.randint(150, 300)
+    recorder = TelemetryRecorder(path, capacity=capacity, index_slots=rng.choice([1, 4, 16]))
+    appended = []
+    try:
+        for i in range(appends):
+            frame = os.urandom(rng.randint(0, max_frame))
+            recorder.append(frame, received_at=float(i))
+            if len(frame) + _RECORD_HEADER.size <= capacity:
+                appended.append((float(i), frame))
+            recorder.buf.flush()
+            recording = TelemetryRecording(path)
+            try:
+                frames = list(recording.frames())
+                expected = appended[len(appended) - len(frames):] if frames else []
+                if frames != expected:
+                    raise AssertionError(f"capacity {capacity}: read back {len(frames)} frame(s) that differ from the last appended")
+                # Whatever was just appended (if it fits) must be readable.
+                if len(frame) + _RECORD_HEADER.size <= capacity and frames[-1][1] != frame:
+                    raise AssertionError(f"capacity {capacity}: newest frame missing after append {i}")
+                if frames:
+                    start_ts = frames[len(frames) // 2][0]
+                    assert list(recording.frames(start_ts=start_ts)) == frames[len(frames) // 2:]
+            finally:
+                recording.close()
+    finally:
+        recorder.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=400)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    failures = 0
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "ring.nftr")
+        for run in range(args.runs):
+            try:
+                run_once(random.Random(args.seed + run), path)
+            except (AssertionError, ValueError) as e:
+                failures += 1
+                print(f"run {run}: {e}")
+    print(f"{failures}/{args.runs} runs failed")
+    raise SystemExit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
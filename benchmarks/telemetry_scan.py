@@ -0,0 +1,101 @@
+"""Compare the retain_key wire scanner against a full betterproto2 parse.
+
+Run from the repository root:
+
+    python -m benchmarks.telemetry_scan
+
+Frames are built the way robots send them: the 30 Hz physics frame from
+SimulatedRobot._physics_loop, a component status update, and a large TargetList.
+"""
+import random
+import time
+import timeit
+
+from nf_robot.generated.nf import telemetry, common
+
+from app.telemetry_wire import scan_retained
+
+
+def _vec3():
+    return common.Vec3(x=random.uniform(-2.5, 2.5), y=random.uniform(-2.5, 2.5), z=random.uniform(0, 2.5))
+
+
+def physics_frame() -> bytes:
+    pos_est = telemetry.PositionEstimate(
+        gantry_position=_vec3(),
+        gantry_velocity=_vec3(),
+        gripper_pose=common.Pose(position=_vec3(), rotation=_vec3()),
+        data_ts=time.time(),
+        slack=[False, False, False, False],
+    )
+    pos_factors = telemetry.PositionFactors(visual_pos=_vec3(), visual_vel=_vec3(), hanging_pos=_vec3(), hanging_vel=_vec3())
+    grip_sensors = telemetry.GripperSensors(range=0.4, angle=30.0, pressure=0.0, wrist=540.0)
+    cmd_vel = telemetry.CommandedVelocity(velocity=_vec3())
+    return bytes(telemetry.TelemetryBatchUpdate(
+        robot_id="bench_robot",
+        updates=[
+            telemetry.TelemetryItem(pos_estimate=pos_est, retain_key="pos_estimate"),
+            telemetry.TelemetryItem(pos_factors_debug=pos_factors),
+            telemetry.TelemetryItem(grip_sensors=grip_sensors, retain_key="grip_sensors"),
+            telemetry.TelemetryItem(last_commanded_vel=cmd_vel, retain_key="cmd_vel"),
+        ],
+    ))
+
+
+def conn_status_frame() -> bytes:
+    status = telemetry.ComponentConnStatus(
+        is_gripper=False,
+        anchor_num=2,
+        websocket_status=telemetry.ConnStatus.CONNECTED,
+        video_status=telemetry.ConnStatus.CONNECTED,
+        ip_address="192.168.1.102",
+    )
+    return bytes(telemetry.TelemetryBatchUpdate(
+        robot_id="bench_robot",
+        updates=[telemetry.TelemetryItem(component_conn_status=status, retain_key="conn_status_anchor_2")],
+    ))
+
+
+def target_list_frame(n_targets: int = 200) -> bytes:
+    targets = [
+        telemetry.OneTarget(id=f"t{i}", position=_vec3(), coords=_vec3(), source="overhead")
+        for i in range(n_targets)
+    ]
+    return bytes(telemetry.TelemetryBatchUpdate(
+        robot_id="bench_robot",
+        updates=[telemetry.TelemetryItem(target_list=telemetry.TargetList(targets=targets), retain_key="target_list")],
+    ))
+
+
+def parse_path(frame: bytes):
+    """What handle_robot_connection used to do per frame."""
+    batch = telemetry.TelemetryBatchUpdate().parse(frame)
+    return [(item.retain_key, bytes(item)) for item in batch.updates if item.retain_key is not None]
+
+
+def check_equivalent(frame: bytes):
+    scanned = scan_retained(frame)
+    parsed = parse_path(frame)
+    assert [k for k, _ in scanned] == [k for k, _ in parsed]
+    for (_, raw), (_, reencoded) in zip(scanned, parsed):
+        # Same item either way, whatever byte order the two encoders chose.
+        assert telemetry.TelemetryItem().parse(bytes(raw)) == telemetry.TelemetryItem().parse(reencoded)
+
+
+def main():
+    frames = {
+        "physics (30 Hz)": physics_frame(),
+        "conn status": conn_status_frame(),
+        "target list x200": target_list_frame(),
+    }
+    print(f"{'frame':<20}{'bytes':>8}{'parse us':>12}{'scan us':>12}{'speedup':>10}")
+    for name, frame in frames.items():
+        check_equivalent(frame)
+        number = 2000 if len(frame) < 1000 else 200
+        parse_us = min(timeit.repeat(lambda: parse_path(frame), number=number, repeat=5)) / number * 1e6
+        scan_us = min(timeit.repeat(lambda: scan_retained(frame), number=number, repeat=5)) / number * 1e6
+        print(f"{name:<20}{len(frame):>8}{parse_us:>12.1f}{scan_us:>12.1f}{parse_us / scan_us:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
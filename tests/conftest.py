@@ -0,0 +1,4 @@
+import os
+
+# app.database creates its engine at import time but doesn't connect, so any URL will do.
+os.environ.setdefault("DATABASE_URL", "postgresql+asyncpg://test@localhost/test")
@@ -0,0 +1,36 @@
+"""Blocking Firebase/Stripe SDK calls must not delay telemetry on its way to viewers."""
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app.sdk_calls import ServiceExecutor
+from benchmarks.sdk_call_stalls import fake_get_user, on_loop, scenario, via_executors
+
+RUN_SECONDS = 1.5
+
+
+def test_relay_keeps_pace_while_sdk_calls_block_their_executors():
+    lateness = asyncio.run(scenario(via_executors, RUN_SECONDS))
+    assert len(lateness) > RUN_SECONDS * 30 * 0.8
+    assert lateness[-1] < 0.1, f"a frame was relayed {lateness[-1] * 1e3:.0f} ms late"
+
+
+def test_sdk_calls_on_the_event_loop_stall_the_relay():
+    # Without the executors the same stand-ins hold up delivery, so the test above can tell.
+    lateness = asyncio.run(scenario(on_loop, RUN_SECONDS, callers=1))
+    assert lateness[-1] > 0.25
+
+
+def test_timed_out_call_keeps_its_slot_until_it_returns():
+    async def run():
+        executor = ServiceExecutor("stand-in", max_concurrency=1, timeout=0.1)
+        with pytest.raises(HTTPException) as excinfo:
+            await executor.run(fake_get_user, "uid")
+        assert excinfo.value.status_code == 504
+        assert executor.in_flight == 1
+        await asyncio.sleep(0.3)
+        assert executor.in_flight == 0
+        assert executor.stats()["timeouts"] == 1
+
+    asyncio.run(run())
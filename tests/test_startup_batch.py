@@ -0,0 +1,40 @@
+"""Startup batches built by concatenating stored item bytes decode like the betterproto2 ones."""
+import pytest
+from nf_robot.generated.nf import telemetry
+
+from app.startup_snapshot import StartupSnapshot
+from app.telemetry_wire import encode_uplink_item, iter_items, scan_retained
+from benchmarks.startup_batch import concat_path, reserialize_path, retained_items
+from benchmarks.telemetry_scan import physics_frame
+
+
+@pytest.mark.parametrize("online", [True, False])
+def test_uplink_item_matches_betterproto(online):
+    expected = bytes(telemetry.TelemetryItem(uplink_status=telemetry.UplinkStatus(online=online)))
+    assert encode_uplink_item(online) == expected
+
+
+@pytest.mark.parametrize("robot_id", ["bench_robot", "", "ünïcode-robot"])
+@pytest.mark.parametrize("n_targets", [None, 0, 500])
+def test_concatenated_batch_round_trips(robot_id, n_targets):
+    items = [] if n_targets is None else retained_items(n_targets)
+    encoded = concat_path(robot_id, True, items)
+    parsed = telemetry.TelemetryBatchUpdate().parse(encoded)
+    assert parsed == telemetry.TelemetryBatchUpdate().parse(reserialize_path(robot_id, True, items))
+    assert parsed.robot_id == robot_id
+    # The item records come back out byte-for-byte, after the uplink status.
+    assert [bytes(item) for item in iter_items(encoded)][1:] == items
+
+
+def test_snapshot_encodes_seeded_and_streamed_items():
+    items = retained_items(50)
+    snapshot = StartupSnapshot("robot")
+    snapshot.seed(True, {f"seeded_{i}".encode(): item for i, item in enumerate(items)})
+    frame = physics_frame()
+    snapshot.apply_frame(frame)
+
+    parsed = telemetry.TelemetryBatchUpdate().parse(snapshot.encode())
+    assert parsed.robot_id == "robot"
+    assert parsed.updates[0] == telemetry.TelemetryItem(uplink_status=telemetry.UplinkStatus(online=True))
+    expected = items + [bytes(item) for _, item in scan_retained(frame)]
+    assert [bytes(item) for item in iter_items(snapshot.encode())][1:] == expected